@@ -13,11 +13,12 @@
 
 from heapq import *
 import math
+import sys
 import time
-import argparse
-import PIL
-import PIL.Image
+from array import array
 from collections import namedtuple
+from collections.abc import Sequence
+from itertools import chain
 
 #
 #  You will need to install the python package Pillow for this to work
@@ -67,6 +68,126 @@ from collections import namedtuple
 # In Uniform Cost Search (ala Dijkstra's) f = g
 TNode = namedtuple('TNode', ['f', 'g', 'h', 'state', 'parent'])
 
+# Version of the ImageProblem edge cost function.  Cached preprocessing
+# (see mapcache.py) is keyed by it: bump it whenever the costs change.
+COST_VERSION = 1
+
+
+class Path(Sequence):
+    """A path of (x, y) integer states stored as one flat array of int32
+    x, y pairs: 8 bytes per state rather than a tuple of two ints (about
+    120 bytes) per state.  It is a read-only sequence of state tuples,
+    and compares equal to a list of the same states.  Slices are Paths
+    sharing the array, iteration builds the tuples a chunk at a time,
+    and write() and tobytes() serialize the whole path in bulk.  coords
+    is the same array as an (n, 2) numpy array; numpy is only imported
+    when it is used, so short paths cost no import time."""
+
+    CHUNK = 65536      # states converted to tuples at a time
+    VECTORIZE = 20000  # from_indices() decodes longer paths with numpy
+
+    def __init__(self, states=()):
+        """states: any iterable of (x, y) pairs, or an (n, 2) numpy
+        array of them."""
+        if isinstance(states, Path):
+            data = states.data
+        elif hasattr(states, 'dtype'):
+            data = memoryview(states.astype('=i4').reshape(-1)).cast('B').cast('i')
+        else:
+            data = memoryview(array('i', chain.from_iterable(states)))
+        self.data = data
+
+    @classmethod
+    def _wrap(cls, data):
+        path = cls.__new__(cls)
+        path.data = data
+        return path
+
+    @classmethod
+    def from_indices(cls, indices, cols, transpose=False):
+        """The Path of the states with the given flat indices, index =
+        row * cols + col: (row, col) states, or (col, row) if transpose."""
+        if len(indices) > cls.VECTORIZE:
+            import numpy as np
+
+            rows, columns = np.divmod(np.asarray(indices, dtype=np.int64), cols)
+            return cls(np.column_stack((columns, rows) if transpose else (rows, columns)))
+        if transpose:
+            pairs = ((i % cols, i // cols) for i in indices)
+        else:
+            pairs = (divmod(i, cols) for i in indices)
+        return cls._wrap(memoryview(array('i', chain.from_iterable(pairs))))
+
+    @classmethod
+    def frombytes(cls, data):
+        """The Path serialized by tobytes()."""
+        values = array('i')
+        values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return cls._wrap(memoryview(values))
+
+    def tobytes(self):
+        """The coordinates as little endian int32 x, y pairs."""
+        if sys.byteorder == 'little':
+            return self.data.tobytes()
+        values = array('i', self.data)
+        values.byteswap()
+        return values.tobytes()
+
+    def __reduce__(self):
+        return Path.frombytes, (self.tobytes(),)
+
+    @property
+    def coords(self):
+        """The path as an (n, 2) int32 numpy array sharing its memory."""
+        import numpy as np
+
+        return np.frombuffer(self.data, dtype=np.int32).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.data) // 2
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if step == 1:
+                return Path._wrap(self.data[2 * start:2 * max(start, stop)])
+            return Path([self[i] for i in range(start, stop, step)])
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("path index out of range")
+        return self.data[2 * k], self.data[2 * k + 1]
+
+    def __iter__(self):
+        data = self.data
+        for lo in range(0, len(data), 2 * self.CHUNK):
+            values = iter(data[lo:lo + 2 * self.CHUNK].tolist())
+            yield from zip(values, values)
+
+    def __eq__(self, other):
+        if isinstance(other, Path):
+            return self.data == other.data
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        if len(self) <= 8:
+            return "Path(%r)" % list(self)
+        return "Path([%r, %r, ... %d more ..., %r])" % (self[0], self[1], len(self) - 3, self[-1])
+
+    def write(self, f):
+        """Write the states to the text file f, one "(x, y)" per line (as
+        print() shows them)."""
+        data = self.data
+        for lo in range(0, len(data), 2 * self.CHUNK):
+            values = data[lo:lo + 2 * self.CHUNK].tolist()
+            f.write("(%d, %d)\n" * (len(values) // 2) % tuple(values))
+
 
 class SearchProblem():
     """An absract class representing a search problem."""
@@ -80,6 +201,11 @@ class SearchProblem():
         """returns True iff the specified state satisifies the goal condition"""
         pass
 
+    def path_from_indices(self, indices):
+        """A Path of the states with the given flat indices (see
+        to_index)."""
+        return Path(self.from_index(i) for i in indices)
+
 
 class GridProblem(SearchProblem):
     """A Grid Problem allows cardinal direction movement on an 2D grid.
@@ -118,6 +244,44 @@ class GridProblem(SearchProblem):
         else:
             self.h = lambda x: abs(x[0]-4) + abs(x[1]-4)
 
+    def num_states(self):
+        """Number of states (grid cells) in the problem."""
+        return len(self.grid) * len(self.grid[0])
+
+    def index_shape(self):
+        """(rows, cols) of the flat index layout: a state's index is
+        row * cols + col, with state = (row, col)."""
+        return len(self.grid), len(self.grid[0])
+
+    def to_index(self, state):
+        """Encode a state as a flat integer index."""
+        return state[0] * len(self.grid[0]) + state[1]
+
+    def from_index(self, index):
+        """Decode a flat integer index back into a state."""
+        return divmod(index, len(self.grid[0]))
+
+    def path_from_indices(self, indices):
+        return Path.from_indices(indices, len(self.grid[0]))
+
+    def index_successors(self, index):
+        """successors() over flat integer indices: yields
+        (successor index, edge cost) pairs in the same order."""
+        grid = self.grid
+        cols = len(grid[0])
+        r, c = divmod(index, cols)
+        row = grid[r]
+        here = row[c]
+
+        if r > 0:
+            yield index - cols, (here + grid[r-1][c]) / 2.0
+        if r < len(grid)-1:
+            yield index + cols, (here + grid[r+1][c]) / 2.0
+        if c > 0:
+            yield index - 1, (here + row[c-1]) / 2.0
+        if c < cols-1:
+            yield index + 1, (here + row[c+1]) / 2.0
+
     def successors(self, state):
         """In a GridProblem, successor states are vertically
         or horizontally adjacent. The edge weight is the
@@ -151,10 +315,89 @@ class ImageProblem(SearchProblem):
     0 <= y < image.height. Edges connect states in cardinal directions,
     AND diagonals."""
 
-    def __init__(self, imagepth, goaltest, hfn=None):
+    def __init__(self, imagepth, goaltest, hfn=None, precompute=False,
+                 cache=None):
+        """Setup an instance of an ImageProblem.
+
+        Arguments:
+            imagepth:   path of the image to search over
+            goaltest:   a function which takes a state and returns
+                          True iff the state satisifies the goaltest
+            hfn:        a heuristic function which takes a state
+                          and estimates the distance remaining to the goal.
+            precompute: if True, decode the image once and precompute the
+                          edge costs so successors() is plain index lookups
+                          instead of PIL calls.
+            cache:      a mapcache.MapCache; precompute() then memory maps
+                          the cost planes from it instead of rebuilding them.
+        """
+        import PIL.Image
+
+        self.imagepth = imagepth
         self.img = PIL.Image.open(imagepth)
+        self.width, self.height = self.img.size
         self.is_goal = goaltest
         self.h = hfn
+        self.cache = cache
+        self.costs = None
+        if precompute:
+            self.precompute()
+
+    @classmethod
+    def from_costs(cls, width, height, costs, goaltest=None, hfn=None):
+        """Build an ImageProblem straight from the four cost planes made by
+        precompute() (any float sequences, e.g. array('d') or memoryview
+        objects), without an image.  show_path() needs the image, so it
+        is unavailable on such a problem."""
+        prob = cls.__new__(cls)
+        prob.imagepth = None
+        prob.img = None
+        prob.cache = None
+        prob.width, prob.height = width, height
+        prob.is_goal = goaltest
+        prob.h = hfn
+        prob.costs = list(costs)
+        return prob
+
+    def precompute(self):
+        """Decode the image and build the edge cost planes.
+
+        self.costs holds four flat float planes (memoryviews), indexed by
+        y * width + x, giving the cost of the edge from a pixel to its
+        neighbour to the right, below, below-left and below-right.
+        Edge costs are symmetric, so the other four directions are read
+        from the plane of the neighbour.  With a cache the planes are
+        memory mapped from it.  Calling this more than once is a no-op.
+        """
+        if self.costs is not None:
+            return
+        if self.cache is not None:
+            key = self.cache.image_key(self.imagepth)
+            planes = self.cache.get_or_build(key, 'costs', self.cost_planes)
+        else:
+            planes = self.cost_planes()
+        self.costs = [memoryview(p) for p in planes.reshape(4, -1)]
+
+    def cost_planes(self):
+        """Decode the image and return its edge costs as a numpy array of
+        shape (4, height, width), in the plane order of precompute().
+        Entries for edges that leave the image are 0."""
+        import numpy as np
+
+        pixels = np.asarray(self.img.convert('RGB'), dtype=np.int64)
+
+        def plane(a, b):
+            """Cost of the edges between the pixel arrays a and b, summed
+            channel by channel exactly as the edge_cost closure does."""
+            d = (a - b) / 32
+            return 1 + d[..., 0] ** 2 + d[..., 1] ** 2 + d[..., 2] ** 2
+
+        planes = np.zeros((4, self.height, self.width))
+        planes[0, :, :-1] = plane(pixels[:, :-1], pixels[:, 1:])      # right
+        planes[1, :-1, :] = plane(pixels[:-1, :], pixels[1:, :])      # below
+        planes[2, :-1, 1:] = plane(pixels[:-1, 1:], pixels[1:, :-1])  # below-left
+        planes[3, :-1, :-1] = plane(pixels[:-1, :-1], pixels[1:, 1:])  # below-right
+        return planes
 
     def successors(self, state):
         """_ Part 1:  Implement This Method _
@@ -179,6 +422,10 @@ class ImageProblem(SearchProblem):
         tuples of: (nextstate, edgecost)
         """
 
+        if self.costs is not None:
+            yield from self._plane_successors(state)
+            return
+
         def edge_cost(tuple_one, tuple_two) -> float:
             """
                 Returns edge cost between two nodes.
@@ -240,20 +487,248 @@ class ImageProblem(SearchProblem):
                 successor_pixels = self.img.getpixel((ns[0], ns[1]))
                 yield ns, edge_cost(state_pixels, successor_pixels)
 
-    def show_path(self, listofstates, pathfname='path.png'):
+    def num_states(self):
+        """Number of states (pixels) in the problem."""
+        return self.width * self.height
+
+    def index_shape(self):
+        """(rows, cols) of the flat index layout: a state's index is
+        row * cols + col, with state = (col, row)."""
+        return self.height, self.width
+
+    def to_index(self, state):
+        """Encode a state as a flat integer index."""
+        return state[1] * self.width + state[0]
+
+    def from_index(self, index):
+        """Decode a flat integer index back into a state."""
+        y, x = divmod(index, self.width)
+        return (x, y)
+
+    def path_from_indices(self, indices):
+        return Path.from_indices(indices, self.width, transpose=True)
+
+    def index_successors(self, i):
+        """successors() over flat integer indices: yields
+        (successor index, edge cost) pairs in the same order.
+        The cost planes are built on first use."""
+        if self.costs is None:
+            self.precompute()
+        w = self.width
+        x = i % w
+        right, below, below_left, below_right = self.costs
+        left_ok = x > 0
+        right_ok = x < w - 1
+        up_ok = i >= w
+        down_ok = i < (self.height - 1) * w
+
+        if left_ok:
+            yield i-1, right[i-1]
+        if right_ok:
+            yield i+1, right[i]
+        if up_ok:
+            yield i-w, below[i-w]
+        if down_ok:
+            yield i+w, below[i]
+
+        if left_ok:
+            if up_ok:
+                yield i-w-1, below_right[i-w-1]
+            if down_ok:
+                yield i+w-1, below_left[i]
+        if right_ok:
+            if up_ok:
+                yield i-w+1, below_left[i-w+1]
+            if down_ok:
+                yield i+w+1, below_right[i]
+
+    def _plane_successors(self, state):
+        """successors() using the precomputed cost planes."""
+        x, y = state
+        w = self.width
+        i = y * w + x
+        right, below, below_left, below_right = self.costs
+        left_ok = x > 0
+        right_ok = x < w - 1
+        up_ok = y > 0
+        down_ok = y < self.height - 1
+
+        if left_ok:
+            yield (x-1, y), right[i-1]
+        if right_ok:
+            yield (x+1, y), right[i]
+        if up_ok:
+            yield (x, y-1), below[i-w]
+        if down_ok:
+            yield (x, y+1), below[i]
+
+        if left_ok:
+            if up_ok:
+                yield (x-1, y-1), below_right[i-w-1]
+            if down_ok:
+                yield (x-1, y+1), below_left[i]
+        if right_ok:
+            if up_ok:
+                yield (x+1, y-1), below_left[i-w+1]
+            if down_ok:
+                yield (x+1, y+1), below_right[i]
+
+    # Paths painted by render(): the first in red, as show_path() always has.
+    PATH_COLORS = ((255, 0, 0), (0, 160, 0), (0, 0, 255), (255, 0, 255),
+                   (0, 160, 160), (255, 128, 0))
+    HEAT_COLOR = (255, 255, 0)
+
+    def _coords(self, states):
+        """An (n, 2) array of the (x, y) states in a Path, a reached view
+        of an indexed engine, or any iterable of states."""
+        import numpy as np
+
+        if isinstance(states, Path):
+            return states.coords
+        engine = getattr(states, 'engine', None)
+        if engine is not None:  # an IndexedReached: decode its indices at once
+            return self.path_from_indices(np.fromiter(engine.touched, dtype=np.int64)).coords
+        return np.array(list(states), dtype=np.int64).reshape(-1, 2)
+
+    def render(self, paths, reached=()):
+        """An RGB PIL image of the map with every path in paths (lists or
+        Paths of states) painted over it, each in the next PATH_COLORS
+        colour.  reached, a list of the reached collections of searches
+        (engine.reached), is overlaid first as a heatmap: the more
+        searches reached a pixel, the more it is tinted.  All of it is
+        done with a few whole-array operations, however long the paths."""
+        import numpy as np
+        import PIL.Image
+
+        pixels = np.array(self.img.convert('RGB'))
+        if reached:
+            heat = np.zeros((self.height, self.width))
+            for states in reached:
+                coords = self._coords(states)
+                np.add.at(heat, (coords[:, 1], coords[:, 0]), 1)
+            alpha = (0.6 / max(heat.max(), 1) * heat)[:, :, None]
+            pixels = (pixels * (1 - alpha) + np.array(self.HEAT_COLOR) * alpha).astype(np.uint8)
+        coords = [self._coords(states) for states in paths]
+        if coords:
+            colors = np.array(self.PATH_COLORS, dtype=np.uint8)
+            which = np.repeat(np.arange(len(coords)) % len(colors), [len(c) for c in coords])
+            coords = np.concatenate(coords)
+            pixels[coords[:, 1], coords[:, 0]] = colors[which]
+        return PIL.Image.fromarray(pixels)
+
+    def show_path(self, listofstates, pathfname='path.png', reached=None):
         """Given a list of states (each state specified as a tuple of
         (x,y) coordinates within the image, paint all states red and
-        save the image."""
-
-        imgcopy = self.img.copy()
+        save the image.  If reached (an engine's reached collection) is
+        given, it is shown as a heatmap under the path."""
+        if reached is not None or len(listofstates) > Path.VECTORIZE:
+            self.render([listofstates], [reached] if reached is not None else ()).save(pathfname)
+            return
+        # a short path is painted pixel by pixel, without importing numpy
+        img = self.img.convert('RGB')
+        pixels = img.load()
         for state in listofstates:
-            imgcopy.putpixel(state, (255, 0, 0))
-        imgcopy.save(pathfname)
+            pixels[state] = self.PATH_COLORS[0]
+        img.save(pathfname)
+
+    def show_paths(self, paths, pathfname='paths.png', reached=()):
+        """Paint many paths, e.g. the results of a batch of queries, into
+        one image and save it; see render()."""
+        self.render(paths, reached).save(pathfname)
+
+
+class SearchStats():
+    """Instrumentation collected by AStar and GridAStar searches.
+
+    The counters and the total search time are always kept.  The split
+    of that time between the successor function, the heuristic and heap
+    operations is only measured when the engine is created with
+    profile=True, since it costs a clock read around every call.
+    dropped and regenerated are only used by memory bounded searches
+    (see smastar.py): nodes forgotten to stay within the cap, and
+    forgotten states generated again.
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.pushed = 0
+        self.stale_pops = 0
+        self.reexpansions = 0
+        self.max_frontier = 0
+        self.dropped = 0
+        self.regenerated = 0
+        self.search_time = 0.0
+        self.successors_time = 0.0
+        self.h_time = 0.0
+        self.heap_time = 0.0
+
+    def as_dict(self):
+        """The statistics as a plain dict, e.g. for json.dump()."""
+        return dict(vars(self))
+
+
+def _timed(fn, stats, field):
+    """Wrap fn so the time spent in it is added to stats.<field>."""
+    clock = time.perf_counter
+
+    def timed(*args):
+        started = clock()
+        try:
+            return fn(*args)
+        finally:
+            setattr(stats, field, getattr(stats, field) + clock() - started)
+    return timed
+
+
+def _instrumented(engine, successors, h):
+    """The successor function, heuristic, heappush and heappop a search
+    loop should use: the plain ones, or timed wrappers if the engine
+    profiles.  Successors are listed so generator time is counted."""
+    if not engine.profile:
+        return successors, h, heappush, heappop
+    stats = engine.stats
+    return (_timed(lambda s: list(successors(s)), stats, 'successors_time'),
+            _timed(h, stats, 'h_time'),
+            _timed(heappush, stats, 'heap_time'),
+            _timed(heappop, stats, 'heap_time'))
+
+
+# How many expansions a search run with quiet=False makes between
+# progress reports.
+PROGRESS_INTERVAL = 10000
+
+
+def stepwise(engine, expansions=1000, seconds=None):
+    """Drive a search begun with engine.start() (AStar or GridAStar) in
+    slices of at most expansions expansions and seconds seconds.  Yields
+    None after every slice that paused and finally the search's result,
+    a TNode or False, so a caller can interleave many searches, or give
+    up and take engine.best as a best-effort answer:
+
+        a.start(initialstate)
+        for result in stepwise(a, seconds=0.01):
+            ...
+    """
+    result = None
+    while result is None:
+        result = engine.resume(expansions, seconds)
+        yield result
+
+
+def _search_verbosely(engine):
+    """Finish a started search, printing progress every
+    PROGRESS_INTERVAL expansions.  Returns the search's result."""
+    for result in stepwise(engine, PROGRESS_INTERVAL):
+        if result is not None:
+            return result
+        best = engine.best
+        print("expanded %d states, %d on the frontier, best h %.2f at %s" %
+              (engine.stats.expanded, len(engine.frontier), best.h, best.state))
 
 
 class AStar():
 
-    def __init__(self, problem):
+    def __init__(self, problem, consistent=False, profile=False, on_expand=None):
         """Initializer for an AStar search method.
 
         You must maintain the following instance variables:
@@ -262,11 +737,42 @@ class AStar():
           (2) self.frontier:   a priority queue containing TNode instances
                                (also refered to as an open list)
 
+        Superseded frontier entries (a cheaper TNode for the same state
+        was pushed later) are skipped when popped.  The searches keep
+        count of them in self.stale_pops, and of states expanded more
+        than once (possible with an inconsistent heuristic) in
+        self.reexpansions; self.closed holds the expanded states.
+
+        If consistent is True the caller promises the problem's heuristic
+        is consistent, so an expanded state can never be reached more
+        cheaply later; the search then never re-opens closed states.
+        Leave it False to keep the re-opening semantics needed by
+        inconsistent heuristics.
+
+        self.stats is a SearchStats; profile=True also times the
+        successor function, heuristic and heap.  on_expand, if given, is
+        called with (state, g) for every state expanded.
         """
 
         self.problem = problem
+        self.consistent = consistent
+        self.profile = profile
+        self.on_expand = on_expand
         self.reached = {}
         self.frontier = []
+        self.closed = set()
+        self.stats = SearchStats()
+        self.best = None
+        self.costlimit = None
+        self.result = None
+
+    @property
+    def stale_pops(self):
+        return self.stats.stale_pops
+
+    @property
+    def reexpansions(self):
+        return self.stats.reexpansions
 
     def search(self, initialstate, costlimit=None, quiet=True):
         """_ Part 2: Implement This Method _
@@ -285,43 +791,106 @@ class AStar():
           quiet - prints no output if this is True
 
         Returns a TNode constituting a path, or False if the search failed.
+        With quiet=False progress is printed every PROGRESS_INTERVAL
+        expansions.
         """
-        # Initializing root TNode
+        self.start(initialstate, costlimit)
+        if quiet:
+            return self.resume()
+        return _search_verbosely(self)
+
+    def start(self, initialstate, costlimit=None):
+        """Begin a resumable search from initialstate; no state is
+        expanded until resume() is called.  costlimit is as for search()."""
         h = self.problem.h(initialstate)
-        g = 0
-        f = g + h
-        root_node = TNode(f, g, h, initialstate, None)
-        # Adding root to search structures
+        root_node = TNode(h, 0, h, initialstate, None)
         heappush(self.frontier, root_node)
+        self.stats.pushed += 1
         self.reached[initialstate] = root_node
-
-        # Beginning search loop
-        while self.frontier:
-            node = heappop(self.frontier)
-            state = (node.state[0], node.state[1])
-            # Terminating if path has exceeded limit
-            if costlimit is not None and node.g > costlimit:
-                return False
-
-            # Checking for goal state
-            if self.problem.is_goal(state):
-                return node
-            # Evaluating potential moves
-            for child in self.problem.successors(state):
-                # Adding child to 'reached' or updating previous
-                # entry if current path is cheaper than last
-                child_state = child[0]
-                path_cost = node.g + child[1]  # running cost + action cost
-                if child_state not in self.reached or path_cost < self.reached[child_state].g:
-                    # creating new TNode
-                    h = self.problem.h(child_state)
-                    g = path_cost
-                    f = g + h
-                    new_node = TNode(f, g, h, child_state, node)
-                    self.reached[child_state] = new_node
-                    heappush(self.frontier, new_node)
-
-        return False
+        self.best = root_node
+        self.costlimit = costlimit
+        self.result = None
+
+    def resume(self, expansions=None, seconds=None):
+        """Continue the search begun by start() for at most expansions
+        more expansions and seconds more seconds (None: no limit).
+
+        Returns the goal TNode or False once the search has finished (and
+        again on later calls), or None if it paused on the budget.  While
+        paused, self.best is the expanded node with the smallest
+        heuristic value, and list_of_states(self.best) a best-effort path
+        towards the goal.
+        """
+        if self.result is not None:
+            return self.result
+        stats = self.stats
+        successors, hfn, push, pop = _instrumented(self, self.problem.successors,
+                                                   self.problem.h)
+        is_goal = self.problem.is_goal
+        on_expand = self.on_expand
+        frontier = self.frontier
+        reached = self.reached
+        closed = self.closed
+        consistent = self.consistent
+        costlimit = self.costlimit
+        best = self.best
+        clock = time.perf_counter
+        stop_at = math.inf if expansions is None else stats.expanded + expansions
+        deadline = None if seconds is None else clock() + seconds
+        started = clock()
+        try:
+            # Beginning search loop
+            while frontier:
+                if stats.expanded >= stop_at or (deadline is not None and clock() >= deadline):
+                    return None
+                node = pop(frontier)
+                state = (node.state[0], node.state[1])
+                # Skipping entries superseded by a cheaper path
+                if reached[state] is not node:
+                    stats.stale_pops += 1
+                    continue
+                # Terminating if path has exceeded limit
+                if costlimit is not None and node.g > costlimit:
+                    break
+
+                # Checking for goal state
+                if is_goal(state):
+                    self.result = best = node
+                    return node
+                stats.expanded += 1
+                if state in closed:
+                    stats.reexpansions += 1
+                else:
+                    closed.add(state)
+                if node.h < best.h:
+                    best = node
+                if on_expand is not None:
+                    on_expand(state, node.g)
+                # Evaluating potential moves
+                for child in successors(state):
+                    # Adding child to 'reached' or updating previous
+                    # entry if current path is cheaper than last
+                    child_state = child[0]
+                    if consistent and child_state in closed:
+                        continue
+                    path_cost = node.g + child[1]  # running cost + action cost
+                    if child_state not in reached or path_cost < reached[child_state].g:
+                        # creating new TNode
+                        h = hfn(child_state)
+                        g = path_cost
+                        f = g + h
+                        new_node = TNode(f, g, h, child_state, node)
+                        reached[child_state] = new_node
+                        push(frontier, new_node)
+                        stats.pushed += 1
+                if len(frontier) > stats.max_frontier:
+                    stats.max_frontier = len(frontier)
+
+            self.result = False
+            return False
+        finally:
+            self.best = best
+            stats.search_time += clock() - started
 
     def list_of_states(self, treenode):
         """Given a TNode instance, create a list of states representing
@@ -329,22 +898,422 @@ class AStar():
         This should be obtainable by following the parent references from the
         given TNode back to the root.
 
-        Returns a list of states, the first state should be an initial state,
+        Returns a Path of states, the first state should be an initial state,
         the last state should be the state represented by the specified TNode
         instance"""
 
-        stack = []
+        states = []
         node = treenode
         while node:
-            (f, g, h, s, parent) = node
-            stack.append(TNode(f, g, h, s, None))
-            node = parent
-        stack.reverse()
-        return [s.state for s in stack]
+            states.append(node.state)
+            node = node.parent
+        states.reverse()
+        return Path(states)
+
+
+def path_from_parents(problem, parent_of, i):
+    """The Path of states from the root of a search tree to the state
+    with index i, where parent_of(index) is the index of a state's
+    parent, or -1 at the root."""
+    indices = array('l')
+    while i != -1:
+        indices.append(i)
+        i = parent_of(i)
+    indices.reverse()
+    return problem.path_from_indices(indices)
+
+
+def in_bounds(problem, state):
+    """True iff state is a state of the problem, which provides the
+    index_successors() interface.  to_index() wraps coordinates outside
+    the map into other states, so the index must decode back to state."""
+    try:
+        i = problem.to_index(state)
+    except (TypeError, IndexError):
+        return False
+    return 0 <= i < problem.num_states() and problem.from_index(i) == tuple(state)
 
 
-if __name__ == "__main__":
-    # You shouldn't need to modify this...
+class IndexedReached():
+    """A read-only, dict-like view of the states reached by a GridAStar
+    search.  Supports len(), membership tests and iteration over states,
+    which is all the callers of AStar.reached rely on."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __len__(self):
+        return len(self.engine.touched)
+
+    def __contains__(self, state):
+        engine = self.engine
+        problem = engine.problem
+        return in_bounds(problem, state) and engine.is_reached(problem.to_index(state))
+
+    def __iter__(self):
+        from_index = self.engine.problem.from_index
+        return (from_index(i) for i in self.engine.touched)
+
+
+class GridAStar():
+    """A* search for grid shaped problems (GridProblem, ImageProblem).
+
+    States are encoded as flat integers via the problem's to_index()
+    and from_index() methods.  Path costs and parent pointers live in
+    preallocated typed arrays and the frontier holds only (f, index)
+    pairs, so no TNode is allocated per push.  search() and
+    list_of_states() behave like their AStar counterparts, including
+    skipping superseded frontier entries, the consistent flag and the
+    stats, profile and on_expand instrumentation.  The closed set is a
+    bytearray with one flag per state.
+    """
+
+    def __init__(self, problem, consistent=False, profile=False, on_expand=None):
+        self.problem = problem
+        self.consistent = consistent
+        self.profile = profile
+        self.on_expand = on_expand
+        n = problem.num_states()
+        self.g = array('d', [math.inf]) * n
+        self.f = array('d', [math.inf]) * n
+        self.parent = array('q', [-1]) * n
+        self.closed = bytearray(n)
+        self.stats = SearchStats()
+        self.touched = []
+        self.frontier = []
+        self.reached = IndexedReached(self)
+        self.best_index = -1
+        self.best_h = math.inf
+        self.costlimit = None
+        self.result = None
+
+    @property
+    def stale_pops(self):
+        return self.stats.stale_pops
+
+    @property
+    def reexpansions(self):
+        return self.stats.reexpansions
+
+    def is_reached(self, index):
+        """True iff the state with the given index has been reached."""
+        return self.g[index] < math.inf
+
+    def reset(self):
+        """Forget the previous search so the engine can run another one.
+        Only the entries the previous search touched are restored, so this
+        costs O(reached states) rather than reallocating the arrays."""
+        g, f, parent, closed = self.g, self.f, self.parent, self.closed
+        inf = math.inf
+        for i in self.touched:
+            g[i] = inf
+            f[i] = inf
+            parent[i] = -1
+            closed[i] = 0
+        self.touched.clear()
+        self.frontier.clear()
+        self.stats = SearchStats()
+        self.best_index = -1
+        self.result = None
+
+    @property
+    def best(self):
+        """A TNode (with parent None) for the expanded state with the
+        smallest heuristic value, or None before start()."""
+        i = self.best_index
+        if i < 0:
+            return None
+        state = self.problem.from_index(i)
+        h = self.problem.h(state)
+        return TNode(self.g[i] + h, self.g[i], h, state, None)
+
+    def search(self, initialstate, costlimit=None, quiet=True):
+        """Performs A* Search from initialstate.
+
+        Arguments are as for AStar.search.  Returns a TNode for the goal
+        (with parent None; use list_of_states() to recover the path), or
+        False if the search failed.
+        """
+        self.start(initialstate, costlimit)
+        if quiet:
+            return self.resume()
+        return _search_verbosely(self)
+
+    def start(self, initialstate, costlimit=None):
+        """Begin a resumable search, as AStar.start(), after forgetting
+        the previous one."""
+        problem = self.problem
+        if not in_bounds(problem, initialstate):
+            raise ValueError("initial state %r is outside the map" % (initialstate,))
+        self.reset()
+        start = problem.to_index(initialstate)
+        self.g[start] = 0
+        self.f[start] = self.best_h = problem.h(initialstate)
+        self.parent[start] = -1
+        self.touched.append(start)
+        heappush(self.frontier, (self.f[start], start))
+        self.stats.pushed += 1
+        self.best_index = start
+        self.costlimit = costlimit
+        self.result = None
+
+    def resume(self, expansions=None, seconds=None):
+        """Continue the search begun by start(), as AStar.resume()."""
+        if self.result is not None:
+            return self.result
+        problem = self.problem
+        stats = self.stats
+        successors, h, push, pop = _instrumented(self, problem.index_successors,
+                                                 problem.h)
+        is_goal = problem.is_goal
+        from_index = problem.from_index
+        on_expand = self.on_expand
+        g = self.g
+        fscore = self.f
+        parent = self.parent
+        closed = self.closed
+        consistent = self.consistent
+        touched = self.touched
+        frontier = self.frontier
+        costlimit = self.costlimit
+        best, best_h = self.best_index, self.best_h
+        inf = math.inf
+        clock = time.perf_counter
+        stop_at = inf if expansions is None else stats.expanded + expansions
+        deadline = None if seconds is None else clock() + seconds
+        started = clock()
+        try:
+            while frontier:
+                if stats.expanded >= stop_at or (deadline is not None and clock() >= deadline):
+                    return None
+                f, i = pop(frontier)
+                # Skipping entries superseded by a cheaper path
+                if f > fscore[i]:
+                    stats.stale_pops += 1
+                    continue
+                gi = g[i]
+                # Terminating if path has exceeded limit
+                if costlimit is not None and gi > costlimit:
+                    break
+
+                state = from_index(i)
+                if is_goal(state):
+                    best = i
+                    self.result = TNode(f, gi, h(state), state, None)
+                    return self.result
+                stats.expanded += 1
+                if closed[i]:
+                    stats.reexpansions += 1
+                else:
+                    closed[i] = 1
+                if f - gi < best_h:
+                    best, best_h = i, f - gi
+                if on_expand is not None:
+                    on_expand(state, gi)
+
+                for j, cost in successors(i):
+                    if consistent and closed[j]:
+                        continue
+                    path_cost = gi + cost
+                    gj = g[j]
+                    if path_cost < gj:
+                        if gj == inf:
+                            touched.append(j)
+                        g[j] = path_cost
+                        parent[j] = i
+                        fj = path_cost + h(from_index(j))
+                        fscore[j] = fj
+                        push(frontier, (fj, j))
+                        stats.pushed += 1
+                if len(frontier) > stats.max_frontier:
+                    stats.max_frontier = len(frontier)
+
+            self.result = False
+            return False
+        finally:
+            self.best_index, self.best_h = best, best_h
+            stats.search_time += clock() - started
+
+    def list_of_states(self, treenode):
+        """Given a TNode returned by search(), return the Path of states
+        from the initial state to treenode's state."""
+        return path_from_parents(self.problem, self.parent.__getitem__,
+                                 self.problem.to_index(treenode.state))
+
+
+class BidirectionalAStar():
+    """Bidirectional A* for point-to-point queries on grid shaped
+    problems (GridProblem, ImageProblem) whose edge costs are symmetric.
+
+    A forward search from the initial state and a backward search from
+    the goal state run at the same time, each expanding from whichever
+    frontier is smaller.  Both are ordered with the average potential
+    p(v) = (hf(v) - hb(v)) / 2, where hf is the problem's heuristic
+    (estimating the distance to the goal) and hb estimates the distance
+    from the initial state.  With consistent hf and hb this makes both
+    searches Dijkstra over the same reduced costs, so the search can stop
+    as soon as the two frontier minima sum to at least the cost of the
+    best meeting path found, which is then optimal.
+
+    self.stats is a SearchStats for the latest search, counting the
+    expansions of both directions.
+    """
+
+    def __init__(self, problem, hfn_back=None):
+        """Arguments:
+            problem:   a problem providing the index_successors() interface
+            hfn_back:  a consistent heuristic estimating the distance from
+                         the initial state, or None for zero.
+        """
+        self.problem = problem
+        self.h_back = hfn_back
+        n = problem.num_states()
+        self.g = (array('d', [math.inf]) * n, array('d', [math.inf]) * n)
+        self.f = (array('d', [math.inf]) * n, array('d', [math.inf]) * n)
+        self.parent = (array('q', [-1]) * n, array('q', [-1]) * n)
+        self.frontier = ([], [])
+        self.touched = []
+        self.meet = -1
+        self.stats = SearchStats()
+        self.reached = IndexedReached(self)
+
+    @property
+    def stale_pops(self):
+        return self.stats.stale_pops
+
+    def is_reached(self, index):
+        """True iff either search has reached the state with this index."""
+        return self.g[0][index] < math.inf or self.g[1][index] < math.inf
+
+    def reset(self):
+        """Forget the previous search, restoring only the entries it
+        touched, as GridAStar.reset()."""
+        inf = math.inf
+        for side in (0, 1):
+            g, f, parent = self.g[side], self.f[side], self.parent[side]
+            for i in self.touched:
+                g[i] = inf
+                f[i] = inf
+                parent[i] = -1
+            self.frontier[side].clear()
+        self.touched.clear()
+        self.meet = -1
+        self.stats = SearchStats()
+
+    def search(self, initialstate, goalstate, costlimit=None, quiet=True):
+        """Performs bidirectional A* Search from initialstate to goalstate.
+        The problem's is_goal is not used.
+
+        Arguments:
+          costlimit - None (no limit) or a value such that the search
+                       fails once no path of cost <= costlimit can remain
+          quiet - prints no output if this is True
+
+        Returns a TNode for goalstate (with parent None; use
+        list_of_states() to recover the path), or False if the search
+        failed.
+        """
+        self.reset()
+        started = time.perf_counter()
+        try:
+            return self._search(initialstate, goalstate, costlimit)
+        finally:
+            self.stats.search_time += time.perf_counter() - started
+
+    def _search(self, initialstate, goalstate, costlimit):
+        problem = self.problem
+        from_index = problem.from_index
+        successors = problem.index_successors
+        hf = problem.h or (lambda x: 0)
+        hb = self.h_back or (lambda x: 0)
+        touched = self.touched
+        stats = self.stats
+        inf = math.inf
+
+        def potential(i):
+            state = from_index(i)
+            return (hf(state) - hb(state)) / 2.0
+
+        start = problem.to_index(initialstate)
+        goal = problem.to_index(goalstate)
+        for side, root, sign in ((0, start, 1), (1, goal, -1)):
+            self.g[side][root] = 0
+            self.f[side][root] = sign * potential(root)
+            self.parent[side][root] = -1
+            heappush(self.frontier[side], (self.f[side][root], root))
+            stats.pushed += 1
+        touched.append(start)
+        if goal != start:
+            touched.append(goal)
+
+        best = 0 if start == goal else inf
+        self.meet = start if start == goal else -1
+        forward, backward = self.frontier
+        while forward and backward:
+            if forward[0][0] + backward[0][0] >= best:
+                break
+            if costlimit is not None and best == inf and \
+                    forward[0][0] + backward[0][0] > costlimit:
+                return False
+
+            side = 0 if len(forward) <= len(backward) else 1
+            sign = 1 if side == 0 else -1
+            g, fscore, parent = self.g[side], self.f[side], self.parent[side]
+            other_g = self.g[1 - side]
+            frontier = self.frontier[side]
+
+            f, i = heappop(frontier)
+            # Skipping entries superseded by a cheaper path
+            if f > fscore[i]:
+                stats.stale_pops += 1
+                continue
+            stats.expanded += 1
+            gi = g[i]
+            for j, cost in successors(i):
+                path_cost = gi + cost
+                if path_cost < g[j]:
+                    if g[j] == inf and other_g[j] == inf:
+                        touched.append(j)
+                    g[j] = path_cost
+                    parent[j] = i
+                    fj = path_cost + sign * potential(j)
+                    fscore[j] = fj
+                    heappush(frontier, (fj, j))
+                    stats.pushed += 1
+                    if path_cost + other_g[j] < best:
+                        best = path_cost + other_g[j]
+                        self.meet = j
+            if len(forward) + len(backward) > stats.max_frontier:
+                stats.max_frontier = len(forward) + len(backward)
+
+        if best == inf or (costlimit is not None and best > costlimit):
+            return False
+        return TNode(best, best, 0, goalstate, None)
+
+    def list_of_states(self, treenode):
+        """Given the TNode returned by search(), return the Path of states
+        from the initial state to the goal state."""
+        forward, backward = self.parent
+        indices = array('l')
+        i = self.meet
+        while i != -1:
+            indices.append(i)
+            i = forward[i]
+        indices.reverse()
+        i = backward[self.meet]
+        while i != -1:
+            indices.append(i)
+            i = backward[i]
+        return self.problem.path_from_indices(indices)
+
+
+def main(argv=None, maps=None):
+    """Run the command line program with the arguments argv (default
+    sys.argv[1:]).  maps, if given, is a dict in which the decoded maps
+    are kept between calls, keyed by file and modification time (see
+    serve())."""
+    import argparse
+    import os
 
     parser = argparse.ArgumentParser()
     parser.add_argument('image', nargs="?")
@@ -356,42 +1325,324 @@ if __name__ == "__main__":
     parser.add_argument('-n', type=int,
                         help="show only first n states on the path",
                         default=-1)
-
-    args = parser.parse_args()
+    parser.add_argument('--engine', choices=['astar', 'grid', 'bidirectional', 'hpa', 'sma',
+                                             'weighted', 'focal', 'ara'],
+                        default='astar',
+                        help="search engine: 'astar' (TNode based, default), "
+                             "'grid' (integer indexed, for large maps), "
+                             "'bidirectional' (integer indexed, point to point), "
+                             "'hpa' (hierarchical, near optimal), "
+                             "'sma' (memory bounded, see --max-nodes), "
+                             "'weighted' (weighted A*), 'focal' (focal search) "
+                             "or 'ara' (anytime, improving), all three within "
+                             "--weight times optimal")
+    parser.add_argument('--consistent', action='store_true',
+                        help="the heuristic is consistent: never re-open "
+                             "expanded states")
+    parser.add_argument('--cluster-size', type=int, default=16,
+                        help="with --engine hpa, the cluster side length")
+    parser.add_argument('--hpa-refine', choices=['segments', 'corridor'],
+                        default='segments',
+                        help="with --engine hpa, how to refine the abstract path")
+    parser.add_argument('--hpa-exact', action='store_true',
+                        help="with --engine hpa, also find the optimal cost "
+                             "and report the gap")
+    parser.add_argument('--max-nodes', type=int, default=100000,
+                        help="with --engine sma, the most search tree nodes "
+                             "kept in memory (default 100000); with "
+                             "--records-per-node this bounds its memory")
+    parser.add_argument('--records-per-node', type=int, default=8,
+                        help="with --engine sma, records of dropped states "
+                             "kept per search tree node (default 8); a "
+                             "search reaching more states than fit can be "
+                             "very slow")
+    parser.add_argument('--weight', type=float, default=2.0,
+                        help="with --engine weighted, focal or ara, the most "
+                             "the path may cost, as a factor of the optimal "
+                             "cost (ara starts there and works down to 1; "
+                             "default 2)")
+    parser.add_argument('--profile', action='store_true',
+                        help="time the successor function, heuristic and "
+                             "heap operations (astar and grid engines)")
+    parser.add_argument('--budget', type=float, metavar='SECONDS',
+                        help="stop the search after SECONDS and report the "
+                             "best-effort path found so far (astar and grid "
+                             "engines), or the best path found so far (ara)")
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help="write the search statistics to FILE as JSON")
+    parser.add_argument('--queries', metavar='FILE',
+                        help="answer the 'sx sy gx gy' queries in FILE "
+                             "('-' for stdin) against the map, one output "
+                             "line per query")
+    parser.add_argument('--render', metavar='FILE',
+                        help="with --queries on an image, paint every path "
+                             "found into one image FILE")
+    parser.add_argument('--heatmap', action='store_true',
+                        help="shade the states the search reached under the "
+                             "path in path.png")
+    parser.add_argument('--result-cache', type=int, default=0, metavar='N',
+                        help="with --queries, answer repeated and overlapping "
+                             "queries from an LRU cache of N paths (not with "
+                             "--workers)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="with --queries, answer them on this many "
+                             "worker processes")
+    parser.add_argument('--landmarks', type=int, default=0, metavar='K',
+                        help="use the ALT heuristic with K landmarks")
+    parser.add_argument('--landmark-file', metavar='PATH',
+                        help="load the ALT landmark tables from PATH, or "
+                             "build (8 unless --landmarks says) and save "
+                             "them there if it doesn't exist; tables "
+                             "saved for another map are refused")
+    parser.add_argument('--max-tiles', type=int, default=64,
+                        help="with a .tiles map (see tiled.py), the most "
+                             "tiles kept in memory (default 64)")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="cache image preprocessing (cost planes, "
+                             "landmark tables) in DIR across runs")
+    parser.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                        help="evict cached entries beyond this size "
+                             "(default 1024)")
+    parser.add_argument('--worker', action='store_true',
+                        help="read the arguments of one run per line from "
+                             "stdin and answer each in this process, "
+                             "keeping the maps loaded between runs; the "
+                             "output of each run ends with a line "
+                             "'--- done STATUS'")
+
+    args = parser.parse_args(argv)
+    if args.worker:
+        if maps is not None:
+            parser.error("--worker can't be used inside a worker")
+        serve(sys.stdin)
+        return
+    if maps is not None and args.queries == '-':
+        parser.error("a worker reads its runs from stdin, so --queries can't be '-'")
+    if args.workers and (args.landmarks or args.landmark_file):
+        parser.error("--workers can't be combined with landmark heuristics")
+    if args.workers and args.result_cache:
+        parser.error("--workers can't be combined with --result-cache")
+    if args.budget is not None and args.engine not in ('astar', 'grid', 'ara'):
+        parser.error("--budget needs the astar, grid or ara engine")
+    if args.weight < 1:
+        parser.error("--weight must be at least 1")
+    if args.workers and args.image and args.image.endswith('.tiles'):
+        parser.error("--workers can't be combined with a .tiles map")
+    if args.render and not (args.queries and args.image):
+        parser.error("--render needs --queries and an image")
+
+    cache = None
+    if args.cache_dir:
+        import mapcache
+
+        cache = mapcache.MapCache(args.cache_dir, args.cache_size << 20)
 
     if args.image:
-        image = PIL.Image.open(args.image)
-        size = (image.width, image.height)
+        tiles = args.image.endswith('.tiles')
+        key = (args.image, os.path.getmtime(args.image),
+               args.max_tiles if tiles else args.cache_dir)
+        prob = maps.get(key) if maps is not None else None
+        if prob is None and tiles:
+            import tiled
+
+            prob = tiled.TiledImageProblem(args.image, max_tiles=args.max_tiles)
+        elif prob is None:
+            # the image is opened only once; its cost planes are built (or
+            # loaded from the cache) up front when they will be reused
+            prob = ImageProblem(args.image, None, cache=cache,
+                                precompute=maps is not None or cache is not None)
+        if maps is not None:
+            for old in [k for k in maps if k[0] == args.image and k != key]:
+                del maps[old]
+            maps[key] = prob
 
         # This heuristic always works!
         def h_fn(x): return 0
 
-        def goal_fn(x): return x == (size[0] - 1, size[1] - 1)
+        goal = (prob.width - 1, prob.height - 1)
 
-        prob = ImageProblem(args.image, goal_fn, h_fn)
+        def goal_fn(x): return x == goal
+
+        prob.is_goal = goal_fn
+        prob.h = h_fn
     else:
         prob = GridProblem()
-
-    a = AStar(prob)
+        goal = (len(prob.grid) - 1, len(prob.grid[0]) - 1)
+    if not args.queries and not in_bounds(prob, (args.x, args.y)):
+        parser.error("-x %d -y %d is outside the map" % (args.x, args.y))
+
+    hfactory = None
+    if args.landmarks or args.landmark_file:
+        import landmarks
+
+        if args.landmark_file and os.path.exists(args.landmark_file):
+            try:
+                alt = landmarks.Landmarks.load(prob, args.landmark_file)
+            except ValueError as e:
+                parser.error(str(e))
+        elif cache and args.image and not args.landmark_file:
+            alt = landmarks.Landmarks.cached(prob, cache, args.landmarks or 8)
+        else:
+            alt = landmarks.Landmarks.build(prob, args.landmarks or 8)
+            if args.landmark_file:
+                alt.save(args.landmark_file)
+        hfactory = alt.heuristic
+        prob.h = hfactory(goal)
+
+    if args.queries:
+        import batch
+
+        queries = sys.stdin if args.queries == '-' else open(args.queries)
+        queries = batch.read_queries(queries)
+        start = time.time()
+        count = 0
+        if args.workers:
+            import parallel
+
+            with parallel.ParallelRunner(prob, args.workers,
+                                         consistent=args.consistent) as runner:
+                results = runner.run(queries)
+        else:
+            result_cache = None
+            if args.result_cache:
+                import resultcache
+
+                result_cache = resultcache.ResultCache(args.result_cache)
+            runner = batch.BatchSearch(prob, hfactory or batch.zero_heuristic,
+                                       consistent=args.consistent,
+                                       cache=result_cache)
+            results = runner.run_all(queries)
+        paths = []
+        for result in results:
+            print(batch.format_result(result, args.n))
+            count += 1
+            if args.render:
+                paths.append(result.states)
+        stop = time.time()
+        if args.render:
+            prob.show_paths(paths, args.render)
+        print("%d queries answered in %.2f seconds (%.1f queries/sec)" %
+              (count, stop-start, count / max(stop-start, 1e-9)),
+              file=sys.stderr)
+        if args.result_cache:
+            print("result cache: %(hits)d hits, %(subpath_hits)d subpath hits, "
+                  "%(misses)d misses" % result_cache.stats(), file=sys.stderr)
+        return
+
+    if args.engine == 'hpa':
+        import hpa
+
+        a = hpa.HPAStar(prob, args.cluster_size, refine=args.hpa_refine,
+                        exact=args.hpa_exact)
+    elif args.engine == 'bidirectional':
+        a = BidirectionalAStar(prob, hfactory((args.x, args.y)) if hfactory else None)
+    elif args.engine == 'grid':
+        a = GridAStar(prob, consistent=args.consistent, profile=args.profile)
+    elif args.engine == 'sma':
+        import smastar
+
+        try:
+            a = smastar.SMAStar(prob, args.max_nodes, args.records_per_node)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.engine in ('weighted', 'focal', 'ara'):
+        import suboptimal
+
+        if args.engine == 'weighted':
+            a = suboptimal.WeightedAStar(prob, args.weight)
+        elif args.engine == 'focal':
+            a = suboptimal.FocalSearch(prob, args.weight)
+        else:
+            a = suboptimal.ARAStar(prob, args.weight)
+    else:
+        a = AStar(prob, consistent=args.consistent, profile=args.profile)
     start = time.time()
 
     # WARNING: the unit tests will run your program from the command line
     # and look at the output.  Make sure your search obeys the 'quiet' flag.
     # and make sure you you don't change this when you submit.
-    tnode = a.search((args.x, args.y), quiet=(not args.verbose))
+    if args.engine in ('bidirectional', 'hpa'):
+        tnode = a.search((args.x, args.y), goal, quiet=(not args.verbose))
+    elif args.engine == 'ara':
+        tnode = a.search((args.x, args.y), quiet=(not args.verbose), seconds=args.budget)
+    elif args.budget is not None:
+        a.start((args.x, args.y))
+        tnode = a.resume(seconds=args.budget)
+        if tnode is None:
+            tnode = a.best
+            print("Budget exhausted after %d expansions; best-effort path "
+                  "ends at %s, h %.2f" % (a.stats.expanded, tnode.state, tnode.h))
+    else:
+        tnode = a.search((args.x, args.y), quiet=(not args.verbose))
     stop = time.time()
-    states_on_path = a.list_of_states(tnode)
-    left_to_print = args.n
-    for s in states_on_path:
-        if left_to_print == 0:
-            break
-        print(s)
-        left_to_print -= 1
 
+    if not tnode and args.engine == 'sma':
+        sys.exit("No path found within --max-nodes %d" % args.max_nodes)
+    states_on_path = a.list_of_states(tnode)
+    # one bulk write instead of a print() per state
+    (states_on_path if args.n < 0 else states_on_path[:args.n]).write(sys.stdout)
+
+    if args.engine == 'hpa' and args.hpa_exact:
+        print("optimal cost is %.2f, gap %.2f" %
+              (a.result.optimal_cost, a.result.gap))
+    if args.engine in ('weighted', 'focal', 'ara'):
+        print("cost is at most %.3f times optimal (weight %.2f)" %
+              (a.result.bound, a.result.weight))
     print("Path found in %.2f seconds" % (stop-start))
     print("%d states in the reached dict" % len(a.reached))
     print("%d states on path to goal" % len(states_on_path))
     print("cost is: %.2f" % tnode.g)
+    if hasattr(prob, 'tile_stats'):
+        print("tile cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions"
+              % prob.tile_stats(), file=sys.stderr)
+
+    if args.stats_json:
+        import json
+
+        report = {'engine': args.engine,
+                  'seconds': stop - start,
+                  'reached': len(a.reached),
+                  'path_length': len(states_on_path),
+                  'cost': tnode.g}
+        if args.engine in ('weighted', 'focal', 'ara'):
+            report['bound'] = a.result.bound
+        if hasattr(a, 'stats'):
+            report['stats'] = a.stats.as_dict()
+        with open(args.stats_json, 'w') as f:
+            json.dump(report, f, indent=2)
 
     if args.image:
-        prob.show_path(states_on_path)
+        prob.show_path(states_on_path, reached=a.reached if args.heatmap else None)
+
+
+def serve(requests, maps=None):
+    """The --worker loop: run main() on the arguments on each line of
+    requests (split as a shell would), in this process, so the
+    interpreter, the imported modules and the decoded maps stay warm
+    from one run to the next.  After each run, a line '--- done STATUS'
+    is written to stdout, STATUS being the run's exit status."""
+    import shlex
+    import traceback
+
+    maps = {} if maps is None else maps
+    for line in requests:
+        argv = shlex.split(line)
+        if not argv:
+            continue
+        try:
+            main(argv, maps)
+            status = 0
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            # a bad run is reported, and doesn't stop the worker
+            traceback.print_exc()
+            status = 1
+        sys.stderr.flush()
+        print("--- done %d" % status, flush=True)
+
+
+if __name__ == "__main__":
+    main()
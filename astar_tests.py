@@ -1,6 +1,30 @@
 import re
 import unittest
 import astar
+import jps
+import batch
+import parallel
+import landmarks
+import mapcache
+import hpa
+import benchmark
+import server
+import resultcache
+import dynamic
+import smastar
+import distancefield
+import tiled
+import suboptimal
+import numpy as np
+import PIL.Image
+import math
+import random
+import asyncio
+import os
+import tempfile
+import json
+import io
+import pickle
 import subprocess
 import timeout_decorator
 import time
@@ -111,6 +135,667 @@ class AStarTestCase(unittest.TestCase):
         self.assertFalse((1,0) in states, "Didn't expect (1,0) on the path... path should have taken the diagonal")
 
 
+    def test_ImageProblem_precomputedCostsMatch(self):
+        ip = astar.ImageProblem('12x8tricky.png', lambda x: x == (11,7), lambda x: 0)
+        pp = astar.ImageProblem('12x8tricky.png', lambda x: x == (11,7), lambda x: 0, precompute=True)
+        for x in range(12):
+            for y in range(8):
+                self.assertEqual(list(ip.successors((x,y))), list(pp.successors((x,y))),
+                                 "Expected precomputed successors to match at (%d, %d)" % (x, y))
+        a = astar.AStar(pp)
+        pth = a.search((0,0))
+        self.assertEqual("18.41", "%.2f"%pth.g, "Expected a path cost of 18.41 with precomputed costs")
+
+
+    def test_GridAStar_matchesAStar(self):
+        grid = [[1,  10, 10, 1,  1,  1],
+                [1,  1,  10, 1, 10,  1],
+                [10, 1,  1,  1, 30,  1],
+                [10, 10, 10, 1, 10,  1],
+                [10, 10, 10, 2, 1,  1]]
+        gp = astar.GridProblem(grid, hfn=lambda x: 0, goaltest=lambda x: x == (4,5))
+        a = astar.GridAStar(gp)
+        pth = a.search((0,0))
+        self.assertEqual(10, pth.g, "Expected a path cost of 10 on this grid")
+        states = a.list_of_states(pth)
+        self.assertEqual(10, len(states), "Expected path to contain 10 elements")
+        self.assertEqual((0,0), states[0])
+        self.assertTrue((4,3) in a.reached, "Expected (4,3) on reached dict")
+
+        def h(s):
+            return max(abs(s[0] - 79), abs(s[1] - 79))
+
+        expected = astar.AStar(astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), h)).search((35,35))
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), h)
+        a = astar.GridAStar(ip)
+        pth = a.search((35,35))
+        self.assertEqual(expected.g, pth.g, "Expected the same path cost as AStar on '80x80-0.png'")
+        states = a.list_of_states(pth)
+        self.assertEqual((35,35), states[0])
+        self.assertEqual((79,79), states[-1])
+
+
+    def test_GridAStar_reusedEngine(self):
+        gp = astar.GridProblem(hfn=lambda x: 0, goaltest=lambda x: x == (4,4))
+        a = astar.GridAStar(gp)
+        self.assertEqual(8, a.search((0,0)).g)
+        gp.is_goal = lambda x: x == (0,0)
+        pth = a.search((4,4))
+        self.assertEqual(8, pth.g, "Expected a reused engine to forget its previous search")
+        self.assertEqual([(4,4), (0,0)], [a.list_of_states(pth)[k] for k in (0, -1)])
+        fresh = astar.GridAStar(gp)
+        fresh.search((4,4))
+        self.assertEqual(fresh.stats.pushed, a.stats.pushed)
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0)
+        a = astar.GridAStar(ip)
+        a.search((0,0))
+        self.assertTrue((79,79) in a.reached)
+        for outside in ((85, 0), (0, -1), (80, 79), (-1, -1)):
+            self.assertFalse(outside in a.reached, "Didn't expect %r in reached" % (outside,))
+
+
+    def test_AStar_skipsStaleFrontierEntries(self):
+        for engine in (astar.AStar, astar.GridAStar):
+            ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0)
+            a = engine(ip)
+            pth = a.search((35,35))
+            self.assertTrue(pth.f > 204.02 and pth.f < 204.024)
+            self.assertTrue(a.stale_pops > 0, "Expected some superseded entries to be skipped")
+            self.assertEqual(0, a.reexpansions, "Didn't expect re-expansions with h = 0")
+
+
+    def test_AStar_consistentNeverReopens(self):
+        def h(s):
+            return max(abs(s[0] - 79), abs(s[1] - 79))
+
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), h)
+        a = astar.AStar(ip, consistent=True)
+        pth = a.search((35,35))
+        self.assertTrue(pth.f > 204.02 and pth.f < 204.024)
+        self.assertEqual(0, a.reexpansions)
+        self.assertTrue((35,35) in a.closed, "Expected (35,35) in the closed set")
+
+        a = astar.GridAStar(ip, consistent=True)
+        pth = a.search((35,35))
+        self.assertTrue(pth.f > 204.02 and pth.f < 204.024)
+        self.assertEqual(0, a.reexpansions)
+        self.assertEqual(1, a.closed[ip.to_index((35,35))], "Expected (35,35) in the closed set")
+
+
+    def test_BidirectionalAStar_matchesAStar(self):
+        gp = astar.GridProblem()
+        a = astar.BidirectionalAStar(gp)
+        pth = a.search((0,0), (4,4))
+        self.assertEqual(8, pth.g, "Expected a path cost of 8 on the default grid")
+        states = a.list_of_states(pth)
+        self.assertEqual(9, len(states), "Expected path to contain 9 elements")
+        self.assertEqual((0,0), states[0])
+        self.assertEqual((4,4), states[-1])
+        self.assertTrue(a.stats.expanded > 0)
+        # a reused engine starts each search afresh
+        for start, goal in (((4,4), (0,0)), ((2,2), (4,0))):
+            self.assertEqual(astar.BidirectionalAStar(gp).search(start, goal).g, a.search(start, goal).g)
+            self.assertEqual((start, goal), (a.list_of_states(pth)[0], a.list_of_states(pth)[-1]))
+
+        for start, goal in (((35,35), (79,79)), ((0,79), (60,3)), ((12,40), (12,40))):
+            ip = astar.ImageProblem('80x80-0.png', lambda x: x == goal, lambda x: 0)
+            expected = astar.AStar(ip).search(start)
+            a = astar.BidirectionalAStar(ip)
+            pth = a.search(start, goal)
+            self.assertEqual(expected.g, pth.g, "Expected the same cost as AStar from %s to %s" % (start, goal))
+            states = a.list_of_states(pth)
+            self.assertEqual(start, states[0])
+            self.assertEqual(goal, states[-1])
+
+
+    def test_JumpPointSearch_matchesAStar(self):
+        gp = astar.GridProblem()
+        j = jps.JumpPointSearch(gp)
+        pth = j.search((0,0), (4,4))
+        self.assertEqual(8, pth.g, "Expected a path cost of 8 on the default grid")
+        states = j.list_of_states(pth)
+        self.assertEqual(9, len(states), "Expected path to contain 9 elements")
+        # a reused engine starts each search afresh
+        for start, goal in (((4,4), (0,0)), ((2,2), (0,0))):
+            pth = j.search(start, goal)
+            self.assertEqual(jps.JumpPointSearch(gp).search(start, goal).g, pth.g)
+            self.assertEqual(start, j.list_of_states(pth)[0])
+
+        grid = jps.plateau_grid(60, 12, seed=3)
+        for start, goal in (((0,0), (59,59)), ((30,2), (4,50)), ((59,0), (0,59))):
+            gp = astar.GridProblem(grid, goaltest=lambda x: x == goal, hfn=lambda x: 0)
+            a = astar.AStar(gp)
+            expected = a.search(start)
+            j = jps.JumpPointSearch(gp)
+            pth = j.search(start, goal)
+            self.assertEqual(expected.g, pth.g, "Expected the same cost as AStar from %s to %s" % (start, goal))
+            states = j.list_of_states(pth)
+            self.assertEqual(start, states[0])
+            self.assertEqual(goal, states[-1])
+            self.assertTrue(j.expansions < len(a.closed), "Expected JPS to expand fewer states than AStar")
+
+
+    def test_BatchSearch_reusesOneEngine(self):
+        ip = astar.ImageProblem('80x80-0.png', None, precompute=True)
+        runner = batch.BatchSearch(ip, batch.chebyshev_heuristic, consistent=True)
+        engine = runner.engine
+        queries = list(batch.read_queries(["35 35 79 79", "# comment", "", "0 0 79 79", "35 35 79 79"]))
+        results = list(runner.run_all(queries))
+        self.assertEqual(3, len(results))
+        self.assertIs(engine, runner.engine, "Expected the engine to be reused")
+        self.assertTrue(results[0].cost > 204.02 and results[0].cost < 204.024)
+        self.assertEqual("287.50", "%.2f" % results[1].cost)
+        self.assertEqual(results[0], results[2], "Expected repeated queries to give the same result")
+        self.assertEqual("35 35 79 79 204.02 123 35,35", batch.format_result(results[2], 1))
+        # ends outside the map are rejected per query instead of wrapping into other rows
+        rejected = list(runner.run_all(batch.read_queries(["85 0 79 79", "-1 3 79 79", "0 0 79 80"])))
+        self.assertEqual(["85 0 79 79 error: start (85, 0) is outside the map",
+                          "-1 3 79 79 error: start (-1, 3) is outside the map",
+                          "0 0 79 80 error: goal (79, 80) is outside the map"],
+                         [batch.format_result(r) for r in rejected])
+        grid = batch.BatchSearch(astar.GridProblem())
+        self.assertIsNotNone(grid.run((35, 35), (4, 4)).error)
+        self.assertEqual(8, grid.run((0, 0), (4, 4)).cost)
+
+
+    def test_ParallelRunner_matchesBatchSearch(self):
+        queries = [((35,35), (79,79)), ((0,0), (79,79)), ((70,10), (5,60)), ((3,3), (3,3))]
+        ip = astar.ImageProblem('80x80-0.png', None, precompute=True)
+        expected = list(batch.BatchSearch(ip).run_all(queries))
+        with parallel.ParallelRunner(ip, workers=2) as runner:
+            results = runner.run(queries)
+            self.assertEqual([r.cost for r in expected], [r.cost for r in results],
+                             "Expected parallel costs in input order")
+            self.assertEqual([q[0] for q in queries], [r.start for r in results])
+            self.assertTrue(runner.throughput() > 0)
+
+        gp = astar.GridProblem()
+        with parallel.ParallelRunner(gp, workers=2) as runner:
+            results = runner.run([((0,0), (4,4)), ((4,4), (0,0))])
+        self.assertEqual([8, 8], [r.cost for r in results])
+        self.assertEqual((4,4), results[0].states[-1])
+
+
+    def test_Landmarks_admissibleAndTighter(self):
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0, precompute=True)
+        lm = landmarks.Landmarks.build(ip, 6)
+        self.assertEqual(6, len(set(lm.landmarks)), "Expected 6 distinct landmarks")
+        exact = landmarks.dijkstra(ip, ip.to_index((79,79)))
+        h = lm.heuristic((79,79))
+        for x in range(0, 80, 7):
+            for y in range(0, 80, 7):
+                self.assertTrue(h((x,y)) <= exact[ip.to_index((x,y))], "Expected ALT to be admissible at (%d, %d)" % (x, y))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lm.npy')
+            lm.save(path)
+            loaded = landmarks.Landmarks.load(ip, path)
+            self.assertEqual(lm.landmarks, loaded.landmarks)
+            small = os.path.join(tmp, 'small.npy')
+            landmarks.Landmarks.build(astar.ImageProblem('12x8.png', None), 2).save(small)
+            with self.assertRaises(ValueError):
+                landmarks.Landmarks.load(astar.ImageProblem('12x8tricky.png', None), small)
+            for image in ('12x8tricky.png', '80x80-0.png'):
+                out = subprocess.getoutput("python astar.py %s --landmark-file %s" % (image, small))
+                self.assertIn("different map", out)
+                self.assertNotIn("Traceback", out)
+            ip.h = loaded.heuristic((79,79))
+            a = astar.GridAStar(ip, consistent=True)
+            pth = a.search((35,35))
+        self.assertTrue(pth.f > 204.02 and pth.f < 204.024)
+        plain = astar.GridAStar(astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0))
+        plain.search((35,35))
+        self.assertTrue(len(a.reached) * 4 < len(plain.reached), "Expected ALT to reach far fewer states than h = 0")
+
+
+    def test_MapCache_reusesAndEvicts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = mapcache.MapCache(tmp)
+            ip = astar.ImageProblem('12x8tricky.png', lambda x: x == (11,7), lambda x: 0, cache=cache)
+            ip.precompute()
+            self.assertEqual((0, 1), (cache.hits, cache.misses))
+            cached = astar.ImageProblem('12x8tricky.png', lambda x: x == (11,7), lambda x: 0,
+                                        precompute=True, cache=cache)
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+            self.assertEqual("18.41", "%.2f" % astar.AStar(cached).search((0,0)).g)
+            self.assertNotEqual(cache.image_key('12x8tricky.png'), cache.image_key('12x8.png'))
+
+            cache.max_bytes = cache.size()
+            key = cache.image_key('12x8.png')
+            cache.store(key, 'costs', astar.ImageProblem('12x8.png', None).cost_planes())
+            self.assertTrue(cache.size() <= cache.max_bytes, "Expected eviction to respect max_bytes")
+            self.assertIsNotNone(cache.load(key, 'costs'), "Expected the newest entry to survive eviction")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = subprocess.getoutput("python astar.py 12x8.png -n 0 --cache-dir %s" % tmp)
+            self.assertEqual("cost is: 15.00", out.splitlines()[-1])
+            self.assertTrue(any(f.endswith("-costs.npy") for f in os.listdir(tmp)),
+                            "Expected the default engine to fill the cache too")
+
+
+    def test_HPAStar_reportsGapToOptimal(self):
+        ip = astar.ImageProblem('80x80-0.png', None, precompute=True)
+        h = hpa.HPAStar(ip, cluster_size=10, exact=True)
+        pth = h.search((35,35), (79,79))
+        result = h.result
+        self.assertEqual(pth.g, result.cost)
+        self.assertAlmostEqual(result.abstract_cost, result.cost, msg="Expected segment refinement to keep the abstract cost")
+        self.assertTrue(result.optimal_cost > 204.02 and result.optimal_cost < 204.024)
+        self.assertAlmostEqual(result.cost - result.optimal_cost, result.gap)
+        self.assertTrue(result.gap >= 0)
+        states = h.list_of_states(pth)
+        self.assertEqual((35,35), states[0])
+        self.assertEqual((79,79), states[-1])
+        for a, b in zip(states, states[1:]):
+            self.assertTrue(b in dict(ip.successors(a)), "Expected %s to follow %s" % (b, a))
+
+        c = hpa.HPAStar(ip, cluster_size=10, refine='corridor', exact=True)
+        c.search((35,35), (79,79))
+        self.assertTrue(c.result.cost <= result.cost, "Expected corridor refinement to be no worse")
+
+        gp = astar.GridProblem()
+        h = hpa.HPAStar(gp, cluster_size=2)
+        self.assertEqual(8, h.search((0,0), (4,4)).g)
+
+
+    def test_SearchStats_countsAndProfiles(self):
+        expanded = []
+        gp = astar.GridProblem()
+        a = astar.AStar(gp, on_expand=lambda state, g: expanded.append(state))
+        pth = a.search((0,0))
+        self.assertEqual(8, pth.g)
+        stats = a.stats
+        self.assertEqual(len(expanded), stats.expanded, "Expected on_expand once per expansion")
+        self.assertEqual((0,0), expanded[0])
+        # every push is popped as stale, expanded, popped as the goal or left on the frontier
+        self.assertEqual(stats.pushed, stats.stale_pops + stats.expanded + 1 + len(a.frontier))
+        self.assertTrue(stats.max_frontier >= 1)
+        self.assertEqual(0.0, stats.successors_time, "Didn't expect timings without profile")
+
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0)
+        a = astar.GridAStar(ip, profile=True)
+        a.search((35,35))
+        stats = a.stats.as_dict()
+        self.assertTrue(stats['successors_time'] > 0 and stats['heap_time'] > 0)
+        self.assertTrue(stats['search_time'] >= stats['successors_time'] + stats['heap_time'])
+        self.assertEqual(stats['pushed'], stats['stale_pops'] + stats['expanded'] + 1 + len(a.frontier))
+
+
+    def test_AStar_statsJsonFromScript(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stats.json')
+            subprocess.getoutput("python astar.py --engine grid --profile --stats-json %s" % path)
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(8, report['cost'])
+        self.assertEqual(9, report['path_length'])
+        self.assertTrue(report['stats']['expanded'] > 0)
+
+
+    def test_AStar_resumableMatchesSearch(self):
+        for engine in (astar.AStar, astar.GridAStar):
+            ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79),
+                                    lambda x: max(79 - x[0], 79 - x[1]))
+            whole = engine(ip).search((35,35))
+            a = engine(ip)
+            a.start((35,35))
+            self.assertIsNone(a.resume(seconds=0), "Expected a zero budget to pause at once")
+            results = list(astar.stepwise(a, expansions=50))
+            self.assertTrue(all(r is None for r in results[:-1]) and len(results) > 2)
+            self.assertEqual(whole.g, results[-1].g)
+            self.assertEqual(whole.g, a.resume().g, "Expected a finished search to keep its result")
+            self.assertEqual((79,79), a.best.state)
+
+            a = engine(ip)
+            a.start((35,35))
+            self.assertIsNone(a.resume(expansions=100))
+            self.assertEqual(100, a.stats.expanded)
+            best = a.best
+            states = a.list_of_states(best)
+            self.assertEqual((35,35), states[0])
+            self.assertEqual(best.state, states[-1])
+            self.assertTrue(best.h < 44, "Expected the best-effort path to head for the goal")
+
+
+    def test_PathServer_coalescesAndBoundsPending(self):
+        lines = ['{"op": "info"}', '{"id": "bad", "map": "g", "start": [0, 9], "goal": [4, 4]}']
+        lines += ['{"id": %d, "map": "g", "start": [0, 0], "goal": [4, 4]}' % k for k in range(6)]
+        lines.append('{"id": "p", "map": "g", "start": [4, 4], "goal": [0, 0], "path": true}')
+        lines.append('{"id": "list", "map": ["g"], "start": [0, 0], "goal": [4, 4]}')
+        out = []
+        pending = []
+
+        async def readline():
+            pending.append(10 - len(lines) - len(out))  # read but not yet answered
+            return lines.pop(0) + '\n' if lines else ''
+
+        async def write(text):
+            out.append(json.loads(text))
+
+        async def run():
+            with server.PathServer({'g': astar.GridProblem()}, workers=0, max_pending=3) as srv:
+                await srv.serve(readline, write)
+                return srv
+        srv = asyncio.run(run())
+        byid = {r['id']: r for r in out}
+        self.assertEqual(10, len(out))
+        self.assertIn('unknown map', byid['list']['error'])
+        self.assertEqual([5, 5], byid[None]['maps']['g'])
+        self.assertIn('outside', byid['bad']['error'])
+        self.assertTrue(all(byid[k]['cost'] == 8 and 'path' not in byid[k] for k in range(6)))
+        self.assertEqual([0, 0], byid['p']['path'][-1])
+        self.assertTrue(srv.coalesced > 0, "Expected identical in-flight queries to share a search")
+        self.assertEqual(7, srv.answered)
+        self.assertTrue(max(pending) < 3, "Expected reading to wait while 3 requests are pending")
+
+        async def broken(name, start, goal):
+            raise RuntimeError("pool is broken")
+
+        async def answer(text, query=None):
+            with server.PathServer({'g': astar.GridProblem()}, workers=0) as srv:
+                srv.query = query or srv.query
+                return await srv.answer(text)
+        self.assertEqual({'id': 7, 'error': "search failed: pool is broken"},
+                         asyncio.run(answer('{"id": 7, "map": "g", "start": [0, 0], "goal": [4, 4]}', broken)))
+        bools = asyncio.run(answer('{"id": 8, "map": "g", "start": [true, 0], "goal": [4, 4]}'))
+        self.assertEqual(8, bools['id'])
+        self.assertIn('integer coordinates', bools['error'])
+
+
+    def test_ResultCache_reusesPathsAndSubpaths(self):
+        ip = astar.ImageProblem('80x80-0.png', None)
+        fresh = batch.BatchSearch(ip, batch.chebyshev_heuristic)
+        cache = resultcache.ResultCache(max_entries=2)
+        cached = batch.BatchSearch(ip, batch.chebyshev_heuristic, cache=cache)
+        whole = cached.run((0,0), (79,79))
+        self.assertEqual(whole, cached.run((0,0), (79,79)))
+        self.assertEqual(1, cache.hits)
+        a, b = whole.states[60], whole.states[10]
+        sub = cached.run(a, b)
+        self.assertEqual(1, cache.subpath_hits)
+        self.assertEqual((a, b), (sub.states[0], sub.states[-1]))
+        self.assertAlmostEqual(fresh.run(a, b).cost, sub.cost)
+        self.assertIsInstance(sub.states, astar.Path)
+        forward = cached.run(b, a).states
+        self.assertEqual(whole.states[10:61], forward)
+        self.assertIs(whole.states.data.obj, forward.data.obj, "Expected a slice of the cached Path")
+
+        cached.run((70,5), (75,10))
+        cached.run((5,70), (10,75))
+        self.assertEqual(1, cache.evictions)
+        self.assertIsNone(cache.get(cached.cache_key, (0,0), (79,79)))
+        ip.version = 1
+        misses = cache.misses
+        cached.run((5,70), (10,75))
+        self.assertEqual(misses + 1, cache.misses, "Expected a version bump to invalidate")
+        self.assertEqual(1, len(cache))
+        with self.assertRaises(SystemExit):
+            astar.main(['80x80-0.png', '--queries', 'queries.txt', '--workers', '2',
+                        '--result-cache', '16'])
+
+
+    def test_DStarLite_replanMatchesFreshSearch(self):
+        rng = random.Random(3)
+        grid = [[rng.randint(1, 9) for _ in range(30)] for _ in range(30)]
+        problem = dynamic.DynamicGridProblem(grid)
+        planner = dynamic.DStarLite(problem, lambda s: batch.manhattan_heuristic(s, 1))
+        fresh = batch.BatchSearch(problem)
+        start, goal = (0, 0), (29, 29)
+        node = planner.search(start, goal)
+        initial = planner.stats.expanded
+        self.assertEqual(fresh.run(start, goal).cost, node.g)
+        for step in range(20):
+            path = planner.list_of_states(node)
+            self.assertEqual((start, goal), (path[0], path[-1]))
+            x, y = path[len(path) // 2]
+            problem.set_cost(x, y, math.inf if step % 3 else rng.randint(1, 9))
+            problem.set_cost(rng.randrange(30), rng.randrange(30), rng.randint(1, 9))
+            if step % 4 == 3:
+                start = path[1]
+                node = planner.move_start(start)
+            else:
+                node = planner.replan()
+            self.assertEqual(fresh.run(start, goal).cost, node.g)
+            self.assertTrue(planner.stats.expanded < initial)
+        self.assertEqual(40, problem.version)
+        problem.set_cost(28, 29, math.inf)
+        problem.set_cost(29, 28, math.inf)
+        self.assertFalse(planner.replan(), "Expected no path to a walled in goal")
+
+
+    def test_SMAStar_boundedAndOptimal(self):
+        problem = astar.ImageProblem('80x80-0.png', None, precompute=True)
+        rng = random.Random(2)
+        dropped = 0
+        # one engine per cap, reused for every query; one of the queries
+        # reaches the whole map, so the records must be able to cover it
+        engines = [smastar.SMAStar(problem, 100000), smastar.SMAStar(problem, 500, 16),
+                   smastar.SMAStar(problem, 150, 48)]
+        tight = smastar.SMAStar(problem, 150, 1)
+        for _ in range(8):
+            start = (rng.randrange(80), rng.randrange(80))
+            goal = (rng.randrange(80), rng.randrange(80))
+            problem.is_goal = lambda x, goal=goal: x == goal
+            problem.h = batch.chebyshev_heuristic(goal)
+            reference = astar.GridAStar(problem)
+            expected = reference.search(start)
+            for a in engines + ([tight] if reference.stats.expanded < 1000 else []):
+                node = a.search(start)
+                self.assertTrue(len(a.nodes) <= a.max_nodes)
+                self.assertTrue(len(a.records) <= a.records.capacity)
+                if a.truncated:
+                    continue
+                path = a.list_of_states(node)
+                self.assertEqual((start, goal), (path[0], path[-1]))
+                self.assertAlmostEqual(expected.g, node.g)
+                dropped += a.stats.dropped
+        self.assertTrue(dropped > 0, "Expected the smaller caps to drop nodes")
+        problem.is_goal = lambda x: x == (79, 79)
+        problem.h = batch.chebyshev_heuristic((79, 79))
+        a = smastar.SMAStar(problem, 20, 100)
+        self.assertFalse(a.search((0, 0)), "Expected no path to fit within 20 nodes")
+        self.assertTrue(a.truncated and len(a.nodes) <= 20 and len(a.records) <= 2000)
+        with self.assertRaises(SystemExit):
+            astar.main(['80x80-0.png', '--engine', 'sma', '--records-per-node', '-1'])
+
+
+    def test_Path_compactSlicingAndSerialization(self):
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), lambda x: 0)
+        states = astar.AStar(ip).list_of_states(astar.AStar(ip).search((0,0)))
+        a = astar.GridAStar(ip)
+        path = a.list_of_states(a.search((0,0)))
+        self.assertIsInstance(path, astar.Path)
+        self.assertEqual(list(states), path, "Expected the same path from AStar and GridAStar")
+        self.assertEqual(8 * len(path), path.coords.nbytes)
+        head = path[:5]
+        self.assertTrue(np.shares_memory(head.coords, path.coords), "Expected slices to share the array")
+        self.assertEqual([(0,0)] + list(path[1:5]), head)
+        self.assertEqual((79,79), path[-1])
+        self.assertTrue(path[10] in path and (100, 100) not in path)
+        self.assertEqual(10, path.index(path[10]))
+        self.assertEqual(path, astar.Path.frombytes(path.tobytes()))
+        self.assertEqual(path, pickle.loads(pickle.dumps(path)))
+        out = io.StringIO()
+        head.write(out)
+        self.assertEqual("".join("%s\n" % (s,) for s in head), out.getvalue())
+        grid = astar.GridProblem()
+        self.assertEqual([(0,0), (1,2), (4,4)], grid.path_from_indices([0, 7, 24]))
+
+
+    def test_ImageProblem_rendersPathsAndHeatmap(self):
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), batch.chebyshev_heuristic((79,79)))
+        a = astar.GridAStar(ip)
+        path = a.list_of_states(a.search((35,35)))
+        other = [(x, 0) for x in range(80)]
+        original = np.array(ip.img.convert('RGB'))
+        pixels = np.array(ip.render([path, other], [a.reached]))
+        self.assertEqual((255, 0, 0), tuple(pixels[35, 35]))
+        self.assertEqual((255, 0, 0), tuple(pixels[79, 79]))
+        self.assertEqual(ip.PATH_COLORS[1], tuple(pixels[0, 40]))
+        tinted = [s for s in a.reached if s not in path and s[1] > 0]
+        self.assertTrue(tinted)
+        for x, y in tinted[:20]:
+            self.assertFalse((pixels[y, x] == original[y, x]).all(), "Expected reached states to be shaded")
+        untouched = [(x, y) for x in range(80) for y in range(1, 80) if (x, y) not in a.reached]
+        self.assertTrue(untouched)
+        for x, y in untouched:
+            self.assertTrue((pixels[y, x] == original[y, x]).all(), "Expected unreached pixels unchanged")
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, 'paths.png')
+            ip.show_paths([path, other], fname)
+            saved = np.array(PIL.Image.open(fname))
+            self.assertEqual((255, 0, 0), tuple(saved[35, 35]))
+            x, y = untouched[0]
+            self.assertTrue((saved[y, x] == original[y, x]).all())
+            # long paths are painted by render() rather than pixel by pixel
+            short, long = os.path.join(tmp, 'short.png'), os.path.join(tmp, 'long.png')
+            ip.show_path(path, short)
+            ip.show_path(list(path) * (astar.Path.VECTORIZE // len(path) + 1), long)
+            self.assertTrue((np.array(PIL.Image.open(short)) == np.array(PIL.Image.open(long))).all())
+
+
+    def test_DistanceField_matchesSearches(self):
+        ip = astar.ImageProblem('80x80-0.png', None, precompute=True)
+        field = distancefield.DistanceField.compute(ip, (3,4))
+        heap = distancefield.DistanceField.compute(ip, (3,4), max_sweeps=0)
+        self.assertIsInstance(field.dist, memoryview, "Expected the image field to converge by sweeping")
+        self.assertTrue((field.distances() == heap.distances()).all())
+        search = batch.BatchSearch(ip)
+        rng = random.Random(4)
+        for _ in range(5):
+            goal = (rng.randrange(80), rng.randrange(80))
+            expected = search.run((3,4), goal).cost
+            self.assertEqual(expected, field.distance(goal))
+            path = field.path(goal)
+            self.assertEqual(((3,4), goal), (path[0], path[-1]))
+            cost = sum(dict(ip.successors(a))[b] for a, b in zip(path, path[1:]))
+            self.assertAlmostEqual(expected, cost)
+            partial = distancefield.DistanceField.compute(ip, (3,4), targets=[goal])
+            self.assertEqual(expected, partial.distance(goal))
+            self.assertFalse(partial.complete)
+        grid = distancefield.DistanceField.compute(astar.GridProblem(), (0,0))
+        self.assertEqual(8, grid.distance((4,4)))
+        self.assertEqual(9, len(grid.path((4,4))))
+        self.assertEqual((5, 5), grid.distances().shape)
+
+
+    def test_TiledImageProblem_matchesImageProblem(self):
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79), batch.chebyshev_heuristic((79,79)))
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, '80x80.tiles')
+            tiled.TiledImageProblem.convert('80x80-0.png', fname, tile=16)
+            tp = tiled.TiledImageProblem(fname, ip.is_goal, ip.h, max_tiles=4)
+            self.assertEqual((5, 5), (tp.tiles_x, tp.tiles_y))
+            for y in range(80):
+                for x in range(80):
+                    self.assertEqual(list(ip.successors((x,y))), list(tp.successors((x,y))))
+            expected = astar.AStar(ip).search((0,0))
+            a = astar.AStar(tp)
+            pth = a.search((0,0))
+            self.assertEqual(expected.g, pth.g, "Expected the same cost on the tiled map")
+            stats = tp.tile_stats()
+            self.assertTrue(stats['tiles'] <= 4 and stats['misses'] > 25 and stats['evictions'] > 0)
+            self.assertTrue(stats['hits'] > stats['misses'])
+            self.assertTrue((tp.region(0, 0, 80, 80) == np.asarray(ip.img.convert('RGB'))).all())
+            tp.show_path(a.list_of_states(pth), os.path.join(tmp, 'path.png'))
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'path.png')))
+            queries, render = os.path.join(tmp, 'q.txt'), os.path.join(tmp, 'r.png')
+            with open(queries, 'w') as f:
+                f.write("0 0 79 79\n79 0 0 79\n")
+            subprocess.getoutput("python astar.py %s --queries %s --render %s" % (fname, queries, render))
+            pixels = np.array(PIL.Image.open(render))
+            self.assertEqual((80, 80, 3), pixels.shape)
+            self.assertEqual([(255, 0, 0), (0, 160, 0)], [tuple(pixels[0, 0]), tuple(pixels[0, 79])])
+
+
+    def test_AStar_workerModeAnswersRepeatedRuns(self):
+        lean = subprocess.getoutput("python -c \"import astar, sys; print(sorted({'numpy', 'PIL', 'argparse'} & set(sys.modules)))\"")
+        self.assertEqual("[]", lean, "Expected importing astar not to import numpy, PIL or argparse")
+        single = subprocess.getoutput("python astar.py 12x8.png").splitlines()
+        requests = "12x8.png\n\n12x8.png --engine grid -n 3\n--engine nope\n12x8.png\n"
+        out = subprocess.run([sys.executable, "astar.py", "--worker"], input=requests,
+                             capture_output=True, text=True).stdout
+        runs, lines = [], []
+        for line in out.splitlines():
+            if line.startswith("--- done "):
+                runs.append((int(line.split()[-1]), lines))
+                lines = []
+            else:
+                lines.append(line)
+        self.assertEqual([0, 0, 2, 0], [status for status, _ in runs])
+        timing = re.compile(r"Path found in")
+        expected = [l for l in single if not timing.match(l)]
+        self.assertEqual(expected, [l for l in runs[0][1] if not timing.match(l)])
+        self.assertEqual(expected, [l for l in runs[3][1] if not timing.match(l)])
+        self.assertEqual(single[:3] + single[-2:], runs[1][1][:3] + runs[1][1][-2:])
+
+
+    def test_ARAStar_boundedSuboptimalVariants(self):
+        ip = astar.ImageProblem('80x80-0.png', lambda x: x == (79,79),
+                                lambda s: max(79 - s[0], 79 - s[1]), precompute=True)
+        optimal = astar.GridAStar(ip).search((79,0)).g
+        for weight in (1.5, 3):
+            for a in (suboptimal.WeightedAStar(ip, weight), suboptimal.FocalSearch(ip, weight)):
+                node = a.search((79,0))
+                self.assertTrue(1 <= a.result.bound <= weight)
+                self.assertTrue(optimal <= node.g <= a.result.bound * optimal + 1e-9,
+                                "Expected %s to cost within its bound" % type(a).__name__)
+                path = a.list_of_states(node)
+                self.assertEqual(((79,0), (79,79)), (path[0], path[-1]))
+        ara = suboptimal.ARAStar(ip, weight=3, decrement=0.5)
+        results = list(ara.improve((79,0)))
+        self.assertTrue(len(results) > 1)
+        for before, after in zip(results, results[1:]):
+            self.assertTrue(after.node.g <= before.node.g and after.bound <= before.bound)
+        for r in results:
+            self.assertTrue(r.node.g <= r.bound * optimal + 1e-9)
+        self.assertEqual((optimal, 1.0), (results[-1].node.g, results[-1].bound))
+        fresh = 0
+        for r in results:
+            w = suboptimal.WeightedAStar(ip, r.weight)
+            w.search((79,0))
+            fresh += w.stats.expanded
+        self.assertTrue(ara.stats.expanded < fresh, "Expected ARA* to reuse its earlier iterations")
+        self.assertEqual(results[0].node, ara.search((79,0), seconds=0))
+
+
+    def test_AStar_heatmapWithEveryEngine(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            image = os.path.abspath('80x80-0.png')
+            os.chdir(tmp)
+            try:
+                for engine in ('astar', 'grid', 'bidirectional', 'hpa', 'sma',
+                               'weighted', 'focal', 'ara'):
+                    out = io.StringIO()
+                    sys.stdout, stdout = out, sys.stdout
+                    try:
+                        astar.main([image, '--engine', engine, '--heatmap', '-n', '0'])
+                    finally:
+                        sys.stdout = stdout
+                    self.assertIn("cost is", out.getvalue(), engine)
+                    pixels = np.array(PIL.Image.open('path.png'))
+                    # the grey map turns yellow where reached, red on the path
+                    self.assertTrue((pixels[:, :, 1] > pixels[:, :, 2]).any(), engine)
+                    os.remove('path.png')
+            finally:
+                os.chdir(cwd)
+
+
+    def test_benchmark_suiteAgreesAcrossEngines(self):
+        results = benchmark.run_suite([12], benchmark.DISTRIBUTIONS, ['grid', 'image'],
+                                      ['astar', 'grid', 'bidirectional', 'jps'], ['zero', 'alt'])
+        costs = {}
+        for r in results:
+            self.assertTrue(r['seconds'] >= 0 and r['peak_bytes'] > 0 and r['reached'] > 0)
+            costs.setdefault((r['map'], r['distribution']), set()).add(r['cost'])
+        self.assertEqual(6, len(costs))
+        for key, found in costs.items():
+            self.assertEqual(1, len(found), "Expected every optimal engine to agree on %s" % (key,))
+        mask = benchmark.maze_mask(12, benchmark.np.random.default_rng(0))
+        self.assertTrue(mask[0, 0] and mask[-1, -1], "Expected the maze corners to be open")
+
+
     def test_AStar_asScriptOnGrid(self):
         out = subprocess.getoutput("python astar.py")
         print(out)
@@ -0,0 +1,143 @@
+"""
+    Batch path queries against one preprocessed map.
+
+    Building an ImageProblem re-opens and decodes the image, so answering
+    many queries one at a time repeats that work for every query.  A
+    BatchSearch keeps one problem (with its cost planes) and one GridAStar
+    engine, and answers each (start, goal) query after a cheap reset of
+    the engine's arrays.
+
+    Queries are read one per line as four integers "sx sy gx gy"; blank
+    lines and lines starting with '#' are ignored.  A query with an end
+    outside the map is answered with an error line, and the others are
+    still answered.  From the command line:
+
+    > python astar.py 80x80-0.png --queries queries.txt
+    > python astar.py 80x80-0.png --queries - < queries.txt
+"""
+
+from array import array
+from collections import namedtuple
+from astar import GridAStar, in_bounds
+
+PathQuery = namedtuple('PathQuery', ['start', 'goal'])
+
+# cost is None (and states empty) when no path was found; error is a
+# message if the query was rejected.
+QueryResult = namedtuple('QueryResult', ['start', 'goal', 'cost', 'states', 'error'],
+                         defaults=(None,))
+
+
+def _zero(state):
+    return 0
+
+
+def zero_heuristic(goal):
+    """Heuristic factory for h = 0 (Dijkstra); always admissible."""
+    return _zero
+
+
+def chebyshev_heuristic(goal):
+    """Heuristic factory for ImageProblem: every edge, diagonals included,
+    costs at least 1, so the Chebyshev distance is admissible and
+    consistent."""
+    gx, gy = goal
+
+    def h(state):
+        return max(abs(state[0] - gx), abs(state[1] - gy))
+    return h
+
+
+def manhattan_heuristic(goal, scale=1):
+    """Heuristic factory for GridProblem: the Manhattan distance times the
+    smallest cell weight (scale) is admissible and consistent."""
+    g0, g1 = goal
+
+    def h(state):
+        return scale * (abs(state[0] - g0) + abs(state[1] - g1))
+    return h
+
+
+class BatchSearch():
+    """Answers many start/goal queries against one grid shaped problem."""
+
+    def __init__(self, problem, hfactory=zero_heuristic, consistent=False,
+                 cache=None, map_key=None):
+        """Arguments:
+            problem:   a GridProblem or ImageProblem; its is_goal and h
+                         are replaced for each query
+            hfactory:  a function taking a goal state and returning a
+                         heuristic function for that goal
+            consistent: passed on to GridAStar
+            cache:     a resultcache.ResultCache to answer from, or None
+            map_key:   identifies the map in the cache (default: this
+                         problem object)
+        """
+        self.problem = problem
+        self.hfactory = hfactory
+        self.engine = GridAStar(problem, consistent=consistent)
+        self.cache = cache
+        self.cache_key = (id(problem) if map_key is None else map_key, hfactory)
+
+    def run(self, start, goal):
+        """Answer a single query, returning a QueryResult."""
+        problem = self.problem
+        for key, state in (('start', start), ('goal', goal)):
+            if not in_bounds(problem, state):
+                return QueryResult(start, goal, None, [],
+                                   "%s %r is outside the map" % (key, tuple(state)))
+        cache = self.cache
+        if cache is not None:
+            version = getattr(problem, 'version', 0)
+            result = cache.get(self.cache_key, start, goal, version)
+            if result is not None:
+                return result
+        engine = self.engine
+        engine.reset()
+        problem.is_goal = lambda x: x == goal
+        problem.h = self.hfactory(goal)
+        tnode = engine.search(start)
+        if not tnode:
+            result = QueryResult(start, goal, None, [])
+        else:
+            result = QueryResult(start, goal, tnode.g, engine.list_of_states(tnode))
+        if cache is not None:
+            # g along an optimal path is the cost of each prefix of it
+            g, to_index = engine.g, problem.to_index
+            prefix = array('d', (g[to_index(s)] for s in result.states))
+            cache.put(self.cache_key, result, prefix, version)
+        return result
+
+    def run_all(self, queries):
+        """Answer each PathQuery (or (start, goal) pair) in turn,
+        yielding QueryResults in the same order."""
+        for start, goal in queries:
+            yield self.run(start, goal)
+
+
+def read_queries(fileobj):
+    """Parse "sx sy gx gy" lines from fileobj, yielding PathQuerys."""
+    for lineno, line in enumerate(fileobj, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split()
+        if len(fields) != 4:
+            raise ValueError("line %d: expected 'sx sy gx gy', got %r" % (lineno, line))
+        sx, sy, gx, gy = (int(v) for v in fields)
+        yield PathQuery((sx, sy), (gx, gy))
+
+
+def format_result(result, n=-1):
+    """Format a QueryResult as one line: the start, the goal, the cost
+    ('none' if there is no path), the number of states on the path and
+    then the first n states (all of them if n is negative) as x,y.  A
+    rejected query is the start, the goal and "error: " and the reason."""
+    if result.error is not None:
+        return "%d %d %d %d error: %s" % (result.start + result.goal + (result.error,))
+    states = result.states if n < 0 else result.states[:n]
+    fields = ["%d %d %d %d" % (result.start + result.goal),
+              "none" if result.cost is None else "%.2f" % result.cost,
+              "%d" % len(result.states)]
+    fields.extend("%d,%d" % s for s in states)
+    return " ".join(fields)
@@ -0,0 +1,249 @@
+"""
+    Reproducible benchmark suite for the search engines.
+
+    Generates synthetic maps of each size and cost distribution, both as
+    GridProblem grids and as ImageProblem images:
+
+        uniform - every cell/pixel identical
+        noisy   - independent random weights/colours
+        maze    - a random maze of cheap corridors between expensive walls
+
+    and runs corner to corner queries with each engine and heuristic,
+    recording the path cost, wall time, expansions, reached states and
+    peak memory (measured with tracemalloc in a second, separate run so
+    it does not distort the timings).  Results are written as JSON so
+    runs can be compared across commits:
+
+    > python benchmark.py --sizes 100 200 --output before.json
+    > python benchmark.py --sizes 100 200 --output after.json --compare before.json
+
+    Sizes up to 4000 are supported, but the pure Python engines take
+    minutes per query at that scale; pick engines accordingly.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import PIL.Image
+import astar
+import batch
+import hpa
+import jps
+import landmarks
+
+DISTRIBUTIONS = ('uniform', 'noisy', 'maze')
+ENGINES = ('astar', 'grid', 'bidirectional', 'jps', 'hpa')
+HEURISTICS = ('zero', 'distance', 'alt')
+
+
+def maze_mask(size, rng):
+    """A size x size boolean array, True on the corridors of a random
+    maze carved with an iterative depth first search over 2x2 cells."""
+    cells = max(1, size // 2)
+    open_ = np.zeros((size, size), dtype=bool)
+    seen = np.zeros((cells, cells), dtype=bool)
+    stack = [(0, 0)]
+    seen[0, 0] = True
+    open_[0, 0] = True
+    while stack:
+        r, c = stack[-1]
+        options = [(r + dr, c + dc) for dr, dc in ((0, 1), (1, 0), (0, -1), (-1, 0))
+                   if 0 <= r + dr < cells and 0 <= c + dc < cells and not seen[r + dr, c + dc]]
+        if not options:
+            stack.pop()
+            continue
+        nr, nc = options[rng.integers(len(options))]
+        seen[nr, nc] = True
+        open_[2 * nr, 2 * nc] = True
+        open_[r + nr, c + nc] = True  # the wall cell between the two
+        stack.append((nr, nc))
+    open_[-1, :] |= open_[-2, :] if size > 1 else False
+    open_[:, -1] |= open_[:, -2] if size > 1 else False
+    return open_
+
+
+def make_weights(size, distribution, seed):
+    """A size x size array of GridProblem cell weights."""
+    rng = np.random.default_rng(seed)
+    if distribution == 'uniform':
+        return np.ones((size, size))
+    if distribution == 'noisy':
+        return rng.integers(1, 11, (size, size)).astype(float)
+    return np.where(maze_mask(size, rng), 1.0, 50.0)
+
+
+def make_pixels(size, distribution, seed):
+    """A size x size x 3 uint8 RGB array for an ImageProblem."""
+    rng = np.random.default_rng(seed)
+    if distribution == 'uniform':
+        return np.full((size, size, 3), 128, dtype=np.uint8)
+    if distribution == 'noisy':
+        return rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    value = np.where(maze_mask(size, rng), 220, 20).astype(np.uint8)
+    return np.repeat(value[:, :, None], 3, axis=2)
+
+
+def make_problem(kind, size, distribution, seed, directory):
+    """Build a GridProblem ('grid') or ImageProblem ('image') map."""
+    if kind == 'grid':
+        return astar.GridProblem(make_weights(size, distribution, seed).tolist())
+    path = os.path.join(directory, "%s-%d-%d.png" % (distribution, size, seed))
+    PIL.Image.fromarray(make_pixels(size, distribution, seed)).save(path)
+    return astar.ImageProblem(path, None, precompute=True)
+
+
+def heuristic_factory(name, kind, problem):
+    """The heuristic factory for name ('zero', 'distance' or 'alt'), or
+    None if it doesn't apply.  'distance' is Chebyshev on images and
+    Manhattan scaled by the smallest weight on grids."""
+    if name == 'zero':
+        return batch.zero_heuristic
+    if name == 'alt':
+        return landmarks.Landmarks.build(problem, 8).heuristic
+    if kind == 'image':
+        return batch.chebyshev_heuristic
+    wmin = min(min(row) for row in problem.grid)
+    return lambda goal: batch.manhattan_heuristic(goal, wmin)
+
+
+def run_query(engine, problem, hfactory, start, goal):
+    """Run one query; returns (cost, expanded, reached)."""
+    problem.is_goal = lambda x: x == goal
+    problem.h = hfactory(goal)
+    if engine in ('astar', 'grid'):
+        a = (astar.AStar if engine == 'astar' else astar.GridAStar)(problem)
+        node = a.search(start)
+        expanded = a.stats.expanded
+    elif engine == 'bidirectional':
+        a = astar.BidirectionalAStar(problem, hfactory(start))
+        node = a.search(start, goal)
+        expanded = a.stats.expanded
+    elif engine == 'jps':
+        a = jps.JumpPointSearch(problem)
+        node = a.search(start, goal)
+        expanded = a.expansions
+    else:
+        a = hpa.HPAStar(problem)
+        node = a.search(start, goal)
+        expanded = None
+    return (node.g if node else None), expanded, len(a.reached)
+
+
+def applies(engine, kind, heuristic):
+    """Whether an engine/heuristic combination is meaningful on a map."""
+    if engine == 'jps' and kind != 'grid':
+        return False
+    if engine == 'hpa' and heuristic != 'zero':
+        return False  # HPA* doesn't use the problem's heuristic
+    return True
+
+
+def run_suite(sizes, distributions, kinds, engines, heuristics, seed=0, log=None):
+    """Run every applicable combination, returning a list of result dicts."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            for distribution in distributions:
+                for kind in kinds:
+                    t0 = time.perf_counter()
+                    problem = make_problem(kind, size, distribution, seed, tmp)
+                    build_seconds = time.perf_counter() - t0
+                    start, goal = (0, 0), (size - 1, size - 1)
+                    for heuristic in heuristics:
+                        hfactory = None
+                        for engine in engines:
+                            if not applies(engine, kind, heuristic):
+                                continue
+                            if hfactory is None:
+                                hfactory = heuristic_factory(heuristic, kind, problem)
+                            t0 = time.perf_counter()
+                            cost, expanded, reached = run_query(engine, problem, hfactory, start, goal)
+                            seconds = time.perf_counter() - t0
+                            tracemalloc.start()
+                            run_query(engine, problem, hfactory, start, goal)
+                            peak = tracemalloc.get_traced_memory()[1]
+                            tracemalloc.stop()
+                            result = {'map': kind, 'size': size, 'distribution': distribution,
+                                      'engine': engine, 'heuristic': heuristic,
+                                      'cost': cost, 'seconds': seconds,
+                                      'expanded': expanded, 'reached': reached,
+                                      'peak_bytes': peak, 'map_seconds': build_seconds}
+                            results.append(result)
+                            if log:
+                                log(result)
+    return results
+
+
+def case_key(result):
+    return tuple(result[k] for k in ('map', 'size', 'distribution', 'engine', 'heuristic'))
+
+
+def compare(old, new):
+    """Yield (case, old seconds, new seconds, cost changed) for the cases
+    present in both result lists."""
+    previous = {case_key(r): r for r in old}
+    for r in new:
+        before = previous.get(case_key(r))
+        if before:
+            yield case_key(r), before['seconds'], r['seconds'], before['cost'] != r['cost']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(r):
+    print("%-5s %5d %-7s %-13s %-8s cost %10s %9.3fs %8s expanded %10d bytes" %
+          (r['map'], r['size'], r['distribution'], r['engine'], r['heuristic'],
+           "none" if r['cost'] is None else "%.2f" % r['cost'], r['seconds'],
+           r['expanded'] if r['expanded'] is not None else '-', r['peak_bytes']),
+          flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the search engines on synthetic maps")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200])
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS,
+                        default=list(DISTRIBUTIONS))
+    parser.add_argument('--maps', nargs='+', choices=['grid', 'image'],
+                        default=['grid', 'image'])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--heuristics', nargs='+', choices=HEURISTICS,
+                        default=list(HEURISTICS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json',
+                        help="where to write the JSON results")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="print timings relative to an earlier results file")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.distributions, args.maps, args.engines,
+                        args.heuristics, args.seed, log=print_result)
+    report = {'commit': git_commit(),
+              'python': sys.version.split()[0],
+              'platform': platform.platform(),
+              'seed': args.seed,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+        for case, before, after, changed in compare(old, results):
+            print("%-50s %8.3fs -> %8.3fs  x%.2f%s" %
+                  (" ".join(str(c) for c in case), before, after,
+                   before / after if after else float('inf'),
+                   "  COST CHANGED" if changed else ""))
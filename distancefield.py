@@ -0,0 +1,183 @@
+"""
+    One-to-many shortest path distances.
+
+    A DistanceField holds the distance from one source state to every
+    state of a map, and the parent of every state on a shortest path
+    tree, computed in a single sweep instead of one A* search per
+    target.  Afterwards the distance to any target is a lookup and its
+    path is a walk up the parent field, O(path length):
+
+        field = DistanceField.compute(problem, (0, 0))
+        field.distance((79, 79))
+        field.path((79, 79))
+
+    On an ImageProblem the field is computed with whole-row numpy
+    relaxations (fast sweeping): each sweep runs down and then up the
+    image, relaxing a row from its neighbour row and then along itself,
+    until a sweep changes nothing.  Smooth cost fields converge in a few
+    sweeps; mazes and noise need one per turn in their paths, so after
+    max_sweeps the field falls back to Dijkstra's algorithm.  Other
+    problems (and queries for a few targets, which can stop early) use
+    Dijkstra's algorithm directly.  Both give the same distances.
+"""
+
+from heapq import heappush, heappop
+import math
+from array import array
+import numpy as np
+from astar import path_from_parents
+
+
+class DistanceField():
+    """Distances and shortest path parents from one source state."""
+
+    def __init__(self, problem, source, dist, parent, complete=True):
+        """Wrap computed fields: dist and parent are flat sequences
+        indexed like the problem's states (see to_index), with inf and -1
+        for unreached states and parent -1 for the source.  Use compute()
+        to build them."""
+        self.problem = problem
+        self.source = source
+        self.dist = dist
+        self.parent = parent
+        self.complete = complete
+
+    @classmethod
+    def compute(cls, problem, source, targets=None, max_sweeps=8):
+        """The field of distances from the state source.
+
+        Arguments:
+            problem:    a GridProblem or ImageProblem
+            source:     the state distances are measured from
+            targets:    if given, states whose distances are wanted: the
+                          search stops once they are all settled, and
+                          the field is exact only for states closer than
+                          the farthest of them (complete is False)
+            max_sweeps: on an ImageProblem, the most relaxation sweeps
+                          before falling back to Dijkstra's algorithm
+                          (0 to always use Dijkstra's algorithm)
+        """
+        start = problem.to_index(source)
+        if targets is None and max_sweeps and hasattr(problem, 'cost_planes'):
+            fields = _sweep(problem, start, max_sweeps)
+            if fields is not None:
+                return cls(problem, source, *fields)
+        wanted = None if targets is None else {problem.to_index(t) for t in targets}
+        dist, parent = _dijkstra(problem, start, wanted)
+        return cls(problem, source, dist, parent, complete=targets is None)
+
+    def distance(self, state):
+        """The cost of the shortest path from the source to state
+        (math.inf if it is unreachable)."""
+        return float(self.dist[self.problem.to_index(state)])
+
+    def path(self, state):
+        """The Path of states from the source to state, or None if state
+        is unreachable."""
+        i = self.problem.to_index(state)
+        if self.dist[i] == math.inf:
+            return None
+        return path_from_parents(self.problem, self.parent.__getitem__, i)
+
+    def distances(self):
+        """The distances as a numpy array of the problem's index_shape()."""
+        return np.asarray(self.dist).reshape(self.problem.index_shape())
+
+
+def _dijkstra(problem, start, wanted=None):
+    """Dijkstra's algorithm over index_successors() from start, stopping
+    once every index in wanted (if given) is settled.  Returns (dist,
+    parent) as array('d') and array('l')."""
+    successors = problem.index_successors
+    n = problem.num_states()
+    dist = array('d', [math.inf]) * n
+    parent = array('l', [-1]) * n
+    dist[start] = 0.0
+    frontier = [(0.0, start)]
+    left = set(wanted) if wanted is not None else None
+    while frontier:
+        d, i = heappop(frontier)
+        if d > dist[i]:
+            continue
+        if left is not None:
+            left.discard(i)
+            if not left:
+                break
+        for j, cost in successors(i):
+            nd = d + cost
+            if nd < dist[j]:
+                dist[j] = nd
+                parent[j] = i
+                heappush(frontier, (nd, j))
+    return dist, parent
+
+
+def _row_scan(row, prefix):
+    """Relax a row along itself in both directions.  prefix[x] is the
+    cost of walking from pixel 0 to pixel x, so the cost of the walk
+    from k to x is |prefix[x] - prefix[k]|."""
+    row = np.minimum(row, prefix + np.minimum.accumulate(row - prefix))
+    return np.minimum(row, np.minimum.accumulate((row + prefix)[::-1])[::-1] - prefix)
+
+
+def _sweep(problem, start, max_sweeps):
+    """Fast sweeping over an ImageProblem's cost planes.  Returns (dist,
+    parent) as flat memoryviews of numpy arrays, or None if it didn't
+    converge within max_sweeps."""
+    problem.precompute()
+    h, w = problem.height, problem.width
+    right, below, below_left, below_right = (np.asarray(c).reshape(h, w) for c in problem.costs)
+    d = np.full((h, w), np.inf)
+    d.flat[start] = 0.0
+    prefix = np.zeros((h, w))
+    np.cumsum(right[:, :-1], axis=1, out=prefix[:, 1:])
+    for _ in range(max_sweeps):
+        before = d.copy()
+        for rows in (range(h), range(h - 1, -1, -1)):
+            prev = None
+            for y in rows:
+                row = d[y]
+                if prev is not None:
+                    src = d[prev]
+                    if prev < y:
+                        # from the row above; the edges are stored on it
+                        e = prev
+                        np.minimum(row[:-1], src[1:] + below_left[e, 1:], out=row[:-1])
+                        np.minimum(row[1:], src[:-1] + below_right[e, :-1], out=row[1:])
+                    else:
+                        # from the row below; the edges are stored on this row
+                        e = y
+                        np.minimum(row[1:], src[:-1] + below_left[e, 1:], out=row[1:])
+                        np.minimum(row[:-1], src[1:] + below_right[e, :-1], out=row[:-1])
+                    np.minimum(row, src + below[e], out=row)
+                d[y] = _row_scan(row, prefix[y])
+                prev = y
+        if np.array_equal(before, d):
+            parent = _parents(d, (right, below, below_left, below_right), start)
+            return memoryview(d.ravel()), memoryview(parent.ravel())
+    return None
+
+
+def _parents(d, planes, start):
+    """The parent field of converged distances d: for every reached
+    pixel, the neighbour minimising its distance plus the edge cost."""
+    right, below, below_left, below_right = planes
+    h, w = d.shape
+    best = np.full((h, w), np.inf)
+    parent = np.full((h, w), -1, dtype=np.int64)
+    index = np.arange(h * w).reshape(h, w)
+    # (target slice, source slice, edge costs) for all eight directions
+    a, b = slice(1, None), slice(None, -1)
+    s = slice(None)
+    moves = ((s, a, s, b, right[:, :-1]), (s, b, s, a, right[:, :-1]),
+             (a, s, b, s, below[:-1, :]), (b, s, a, s, below[:-1, :]),
+             (a, b, b, a, below_left[:-1, 1:]), (b, a, a, b, below_left[:-1, 1:]),
+             (a, a, b, b, below_right[:-1, :-1]), (b, b, a, a, below_right[:-1, :-1]))
+    for ty, tx, sy, sx, cost in moves:
+        candidate = d[sy, sx] + cost
+        better = candidate < best[ty, tx]
+        best[ty, tx][better] = candidate[better]
+        parent[ty, tx][better] = index[sy, sx][better]
+    parent[np.isinf(d)] = -1
+    parent.flat[start] = -1
+    return parent.ravel()
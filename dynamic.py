@@ -0,0 +1,308 @@
+"""
+    Incremental replanning on grids whose costs change.
+
+    A DynamicGridProblem is a GridProblem whose cells can be changed in
+    place with set_cost(); every change bumps its version (which also
+    invalidates resultcache entries for it).  A cell of cost math.inf is
+    an obstacle: moves into or out of it are not offered.
+
+    DStarLite plans from a start to a goal and then repairs its plan
+    after cells change, or after the start moves (an agent following the
+    path), instead of searching again from scratch.  It searches
+    backwards from the goal, so the g values of the previous plan stay
+    valid wherever the changes don't reach, and only the states whose
+    distance to the goal changed are expanded again.  Path costs are the
+    same as a fresh search's.
+
+        problem = DynamicGridProblem(grid)
+        planner = DStarLite(problem, batch.manhattan_heuristic)
+        node = planner.search(start, goal)
+        problem.set_cost(3, 4, math.inf)
+        node = planner.replan()
+"""
+
+from heapq import heappush, heappop
+import math
+from array import array
+from astar import GridProblem, IndexedReached, SearchStats, TNode
+
+
+class DynamicGridProblem(GridProblem):
+    """A GridProblem whose cell costs can change between searches."""
+
+    def __init__(self, listoflists=None, goaltest=None, hfn=None):
+        """Arguments are as for GridProblem; the grid is copied."""
+        super().__init__(listoflists, goaltest, hfn)
+        self.grid = [list(row) for row in self.grid]
+        self.version = 0
+        self.watchers = []
+
+    def set_cost(self, x, y, value):
+        """Set the cost of cell (x, y), i.e. grid[x][y]; math.inf blocks
+        the cell.  Notifies the watchers with the cell's index."""
+        self.grid[x][y] = value
+        self.version += 1
+        index = self.to_index((x, y))
+        for watcher in self.watchers:
+            watcher(index)
+
+    def watch(self, callback):
+        """Call callback(index) whenever a cell changes."""
+        self.watchers.append(callback)
+
+    def unwatch(self, callback):
+        self.watchers.remove(callback)
+
+    def index_successors(self, index):
+        grid = self.grid
+        cols = len(grid[0])
+        r, c = divmod(index, cols)
+        row = grid[r]
+        here = row[c]
+        if here == math.inf:
+            return
+        inf = math.inf
+        if r > 0 and grid[r-1][c] != inf:
+            yield index - cols, (here + grid[r-1][c]) / 2.0
+        if r < len(grid)-1 and grid[r+1][c] != inf:
+            yield index + cols, (here + grid[r+1][c]) / 2.0
+        if c > 0 and row[c-1] != inf:
+            yield index - 1, (here + row[c-1]) / 2.0
+        if c < cols-1 and row[c+1] != inf:
+            yield index + 1, (here + row[c+1]) / 2.0
+
+    def successors(self, state):
+        for child, cost in super().successors(state):
+            if cost < math.inf:
+                yield child, cost
+
+
+class DStarLite():
+    """D* Lite over a problem providing the index_successors() interface,
+    with symmetric edge costs (a DynamicGridProblem).
+
+    self.stats counts the work of the latest search(), replan() or
+    move_start(), which all return a TNode with parent None.
+    """
+
+    def __init__(self, problem, hfactory=None):
+        """Arguments:
+            problem:   the problem to plan on; if it has watch() (a
+                         DynamicGridProblem), changes are picked up by
+                         replan()
+            hfactory:  a heuristic factory: hfactory(state) estimates the
+                         distance from state to any other.  It must be
+                         consistent for the costs the grid will take,
+                         not just the current ones.  None for h = 0.
+        """
+        self.problem = problem
+        self.hfactory = hfactory
+        n = problem.num_states()
+        self.g = array('d', [math.inf]) * n
+        self.rhs = array('d', [math.inf]) * n
+        self.seen = bytearray(n)
+        self.touched = []
+        self.frontier = []
+        self.keys = {}      # index -> its key on the frontier
+        self.changed = set()
+        self.km = 0.0
+        self.start = self.goal = -1
+        self.costlimit = None
+        self.h = lambda state: 0
+        self.hv = array('d', [-1.0]) * n
+        self.stats = SearchStats()
+        self.reached = IndexedReached(self)
+        if hasattr(problem, 'watch'):
+            problem.watch(self.changed.add)
+
+    def is_reached(self, index):
+        """True iff the state with the given index has been reached."""
+        return self.g[index] < math.inf or self.rhs[index] < math.inf
+
+    def _h(self, i):
+        """The heuristic of the state with index i, computed once per
+        start state."""
+        v = self.hv[i]
+        if v < 0:
+            v = self.hv[i] = self.h(self.problem.from_index(i))
+        return v
+
+    def _queue(self, u):
+        """Put u on the frontier with its current key if it is locally
+        inconsistent, else take it off."""
+        gu, ru = self.g[u], self.rhs[u]
+        if gu != ru:
+            m = gu if gu < ru else ru
+            key = (m + self._h(u) + self.km, m)
+            self.keys[u] = key
+            heappush(self.frontier, (key[0], m, u))
+            self.stats.pushed += 1
+        else:
+            self.keys.pop(u, None)
+
+    def _update(self, u):
+        """Recompute rhs(u) from its neighbours and requeue u."""
+        g, rhs = self.g, self.rhs
+        if not self.seen[u]:
+            self.seen[u] = 1
+            self.touched.append(u)
+        if u != self.goal:
+            best = math.inf
+            for j, cost in self.problem.index_successors(u):
+                if cost + g[j] < best:
+                    best = cost + g[j]
+            rhs[u] = best
+        self._queue(u)
+
+    def _compute(self):
+        """Expand locally inconsistent states until the start state is
+        consistent and no queued state can lower its distance."""
+        g, rhs, keys, frontier = self.g, self.rhs, self.keys, self.frontier
+        seen, touched = self.seen, self.touched
+        successors = self.problem.index_successors
+        queue, update, hval = self._queue, self._update, self._h
+        stats = self.stats
+        start, goal, km = self.start, self.goal, self.km
+        hstart = hval(start)
+        while True:
+            while frontier and keys.get(frontier[0][2]) != frontier[0][:2]:
+                heappop(frontier)
+                stats.stale_pops += 1
+            if not frontier:
+                break
+            k1, k2, u = frontier[0]
+            gs, rs = g[start], rhs[start]
+            ms = gs if gs < rs else rs
+            if (k1, k2) >= (ms + hstart + km, ms) and gs == rs:
+                break
+            heappop(frontier)
+            gu, ru = g[u], rhs[u]
+            m = gu if gu < ru else ru
+            key = (m + hval(u) + km, m)
+            if (k1, k2) < key:
+                keys[u] = key
+                heappush(frontier, (key[0], m, u))
+                continue
+            del keys[u]
+            stats.expanded += 1
+            if gu > ru:
+                # u's distance dropped: it can only lower its neighbours'
+                g[u] = ru
+                for j, cost in successors(u):
+                    if cost + ru < rhs[j] and j != goal:
+                        rhs[j] = cost + ru
+                        if not seen[j]:
+                            seen[j] = 1
+                            touched.append(j)
+                        queue(j)
+            else:
+                # u's distance rose: recompute every rhs that relied on it
+                g[u] = math.inf
+                update(u)
+                for j, cost in successors(u):
+                    if rhs[j] == cost + gu:
+                        update(j)
+            if len(frontier) > stats.max_frontier:
+                stats.max_frontier = len(frontier)
+
+    def _result(self, costlimit=None):
+        if self.g[self.start] == math.inf:
+            return False
+        cost = 0.0
+        for _, step in self._steps():
+            cost += step
+        if costlimit is not None and cost > costlimit:
+            return False
+        return TNode(cost, cost, 0, self.problem.from_index(self.goal), None)
+
+    def _steps(self):
+        """Yield (index, edge cost) along the current plan from the start,
+        always moving to the neighbour minimising cost + g."""
+        g, goal = self.g, self.goal
+        successors = self.problem.index_successors
+        i = self.start
+        for _ in range(len(g)):
+            if i == goal:
+                return
+            best, step = -1, math.inf
+            for j, cost in successors(i):
+                if best < 0 or cost + g[j] < step + g[best]:
+                    best, step = j, cost
+            if best < 0:
+                return
+            i = best
+            yield i, step
+
+    def search(self, initialstate, goalstate, costlimit=None, quiet=True):
+        """Plan from initialstate to goalstate from scratch.  The
+        problem's is_goal and h are not used.
+
+        Returns a TNode for goalstate (with parent None; use
+        list_of_states() to recover the path), or False if there is no
+        path or it costs more than costlimit.
+        """
+        problem = self.problem
+        g, rhs, seen = self.g, self.rhs, self.seen
+        for i in self.touched:
+            g[i] = rhs[i] = math.inf
+            seen[i] = 0
+        self.touched.clear()
+        self.frontier.clear()
+        self.keys.clear()
+        self.changed.clear()
+        self.stats = SearchStats()
+        self.km = 0.0
+        self.start = problem.to_index(initialstate)
+        self.goal = problem.to_index(goalstate)
+        self.h = self.hfactory(initialstate) if self.hfactory else (lambda state: 0)
+        self.hv = array('d', [-1.0]) * problem.num_states()
+        self.costlimit = costlimit
+        rhs[self.goal] = 0.0
+        self._update(self.goal)
+        self._compute()
+        return self._result(costlimit)
+
+    def replan(self):
+        """Repair the plan after cells changed.  Returns the new TNode or
+        False, as search()."""
+        self.stats = SearchStats()
+        for i in self.changed:
+            # the edges between the cell and its neighbours changed (even
+            # if one end is now an obstacle and no longer lists them)
+            self._update(i)
+            for j in self._neighbours(i):
+                self._update(j)
+        self.changed.clear()
+        self._compute()
+        return self._result(self.costlimit)
+
+    def move_start(self, state):
+        """Plan from a new start (e.g. an agent's position along the
+        path), also repairing any cell changes.  Returns the new TNode or
+        False, as search()."""
+        last = self.problem.from_index(self.start)
+        if self.hfactory:
+            self.h = self.hfactory(state)
+            self.hv = array('d', [-1.0]) * self.problem.num_states()
+            self.km += self.h(last)
+        self.start = self.problem.to_index(state)
+        return self.replan()
+
+    def _neighbours(self, i):
+        rows, cols = self.problem.index_shape()
+        r, c = divmod(i, cols)
+        if r > 0:
+            yield i - cols
+        if r < rows - 1:
+            yield i + cols
+        if c > 0:
+            yield i - 1
+        if c < cols - 1:
+            yield i + 1
+
+    def list_of_states(self, treenode):
+        """The Path of states on the current plan, from the start to the
+        goal."""
+        indices = array('l', [self.start])
+        indices.extend(i for i, _ in self._steps())
+        return self.problem.path_from_indices(indices)
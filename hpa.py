@@ -0,0 +1,252 @@
+"""
+    Hierarchical pathfinding (HPA*) for very large GridProblem and
+    ImageProblem maps.
+
+    The map is cut into square clusters.  Along each border between two
+    clusters a few *transitions* (adjacent cell pairs, the cheapest
+    crossing in each stretch of the border) become nodes of a small
+    abstract graph.  Abstract edges join the two cells of a transition
+    and, inside each cluster, every pair of its transition cells, with
+    the exact cluster-local path cost.  All of this is computed once.
+
+    A query links the start and goal into the abstract graph, searches
+    it, and refines the abstract path into real states.  Refinement is
+    either 'segments' (local searches between consecutive abstract
+    nodes, so the cost equals the abstract cost) or 'corridor' (one
+    search restricted to the clusters the abstract path visits, which is
+    never worse).  Both are near optimal, not optimal.  With exact=True
+    the optimal cost is computed as well and the gap is reported, so the
+    trade off is made knowingly.
+
+    > python astar.py 80x80-0.png --engine hpa --cluster-size 10 --hpa-exact
+"""
+
+from heapq import heappush, heappop
+from collections import namedtuple
+from astar import IndexedReached, Path, TNode
+
+# cost: cost of the returned path; abstract_cost: cost of the abstract
+# path it refines; optimal_cost and gap (cost - optimal_cost) are None
+# unless the search was run with exact=True.
+HPAResult = namedtuple('HPAResult', ['cost', 'states', 'abstract_cost',
+                                     'optimal_cost', 'gap'])
+
+
+def _local_search(successors, start, goal=None, allowed=None):
+    """Dijkstra over index states from start, optionally stopping at goal
+    and only entering indices for which allowed(index) is true.
+    Returns (dist, parent) dicts."""
+    dist = {start: 0.0}
+    parent = {start: -1}
+    frontier = [(0.0, start)]
+    while frontier:
+        d, i = heappop(frontier)
+        if d > dist[i]:
+            continue
+        if i == goal:
+            break
+        for j, cost in successors(i):
+            nd = d + cost
+            if nd < dist.get(j, float('inf')) and (allowed is None or allowed(j)):
+                dist[j] = nd
+                parent[j] = i
+                heappush(frontier, (nd, j))
+    return dist, parent
+
+
+def _unwind(parent, i):
+    path = []
+    while i != -1:
+        path.append(i)
+        i = parent[i]
+    path.reverse()
+    return path
+
+
+class HPAStar():
+    """HPA* over a problem providing the index_successors() interface.
+    The full HPAResult of the last search is kept in self.result."""
+
+    def __init__(self, problem, cluster_size=16, spacing=None,
+                 refine='segments', exact=False):
+        """Arguments:
+            problem:      a GridProblem or ImageProblem
+            cluster_size: side length of the square clusters
+            spacing:      border stretch per transition (default half
+                            the cluster size)
+            refine:       'segments' or 'corridor'
+            exact:        also compute the optimal cost and the gap
+        """
+        if refine not in ('segments', 'corridor'):
+            raise ValueError("refine must be 'segments' or 'corridor', not %r" % (refine,))
+        self.problem = problem
+        self.size = cluster_size
+        self.spacing = spacing or max(1, cluster_size // 2)
+        self.refine = refine
+        self.exact = exact
+        self.rows, self.cols = problem.index_shape()
+        self.edges = {}     # abstract node -> {abstract node: cost}
+        self.members = {}   # cluster -> abstract nodes inside it
+        self.touched = set()  # indices of the states the last search reached
+        self.reached = IndexedReached(self)
+        self.result = None
+        self._build()
+
+    def is_reached(self, index):
+        """True iff the last search reached the state with the given index."""
+        return index in self.touched
+
+    def cluster(self, i):
+        """The (row, col) cluster of the state with index i."""
+        r, c = divmod(i, self.cols)
+        return r // self.size, c // self.size
+
+    def _in_cluster(self, cluster):
+        size, cols = self.size, self.cols
+        r0, c0 = cluster[0] * size, cluster[1] * size
+
+        def allowed(j):
+            r, c = divmod(j, cols)
+            return r0 <= r < r0 + size and c0 <= c < c0 + size
+        return allowed
+
+    def _link(self, a, b, cost):
+        self.edges.setdefault(a, {})
+        self.edges.setdefault(b, {})
+        if cost < self.edges[a].get(b, float('inf')):
+            self.edges[a][b] = cost
+            self.edges[b][a] = cost
+
+    def _add_transitions(self, cells):
+        """cells is a list of (a, b) index pairs straddling one border;
+        the cheapest pair in each stretch of self.spacing becomes a
+        transition."""
+        successors = self.problem.index_successors
+        for k in range(0, len(cells), self.spacing):
+            best = None
+            for a, b in cells[k:k + self.spacing]:
+                cost = dict(successors(a))[b]
+                if best is None or cost < best[2]:
+                    best = (a, b, cost)
+            a, b, cost = best
+            self._link(a, b, cost)
+            for node in (a, b):
+                self.members.setdefault(self.cluster(node), set()).add(node)
+
+    def _build(self):
+        rows, cols, size = self.rows, self.cols, self.size
+        # Transitions across the vertical and horizontal cluster borders.
+        for c in range(size, cols, size):
+            for r0 in range(0, rows, size):
+                self._add_transitions([(r * cols + c - 1, r * cols + c)
+                                       for r in range(r0, min(rows, r0 + size))])
+        for r in range(size, rows, size):
+            for c0 in range(0, cols, size):
+                self._add_transitions([((r - 1) * cols + c, r * cols + c)
+                                       for c in range(c0, min(cols, c0 + size))])
+        # Intra-cluster edges between every pair of transition cells.
+        successors = self.problem.index_successors
+        for cluster, nodes in self.members.items():
+            allowed = self._in_cluster(cluster)
+            for a in nodes:
+                dist, _ = _local_search(successors, a, allowed=allowed)
+                for b in nodes:
+                    if b != a and b in dist:
+                        self._link(a, b, dist[b])
+
+    def _abstract_path(self, start, goal):
+        """Dijkstra over the abstract graph with start and goal linked in.
+        Returns (cost, list of abstract nodes) or (inf, None)."""
+        successors = self.problem.index_successors
+        extra = {start: {}, goal: {}}
+        for end in (start, goal):
+            cluster = self.cluster(end)
+            dist, _ = _local_search(successors, end, allowed=self._in_cluster(cluster))
+            self.touched.update(dist)
+            for node in self.members.get(cluster, ()):
+                if node in dist:
+                    extra[end][node] = dist[node]
+            if end == start and goal in dist:
+                extra[start][goal] = dist[goal]
+
+        def neighbours(u):
+            yield from self.edges.get(u, {}).items()
+            yield from extra.get(u, {}).items()
+            if u in extra[goal]:
+                yield goal, extra[goal][u]
+
+        dist = {start: 0.0}
+        parent = {start: -1}
+        frontier = [(0.0, start)]
+        while frontier:
+            d, u = heappop(frontier)
+            if d > dist[u]:
+                continue
+            if u == goal:
+                return d, _unwind(parent, goal)
+            for v, cost in neighbours(u):
+                nd = d + cost
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    parent[v] = u
+                    heappush(frontier, (nd, v))
+        return float('inf'), None
+
+    def _path_cost(self, path):
+        successors = self.problem.index_successors
+        return sum(dict(successors(a))[b] for a, b in zip(path, path[1:]))
+
+    def search(self, initialstate, goalstate, costlimit=None, quiet=True):
+        """Hierarchical search from initialstate to goalstate.  The
+        problem's is_goal and h are not used.
+
+        Returns a TNode for goalstate (with parent None; use
+        list_of_states() to recover the path), or False if the search
+        failed or the path costs more than costlimit.
+        """
+        problem = self.problem
+        successors = problem.index_successors
+        start = problem.to_index(initialstate)
+        goal = problem.to_index(goalstate)
+        self.touched.clear()
+
+        abstract_cost, nodes = self._abstract_path(start, goal)
+        if nodes is None:
+            self.result = None
+            return False
+
+        if self.refine == 'corridor':
+            corridor = {self.cluster(u) for u in nodes}
+            cols, size = self.cols, self.size
+
+            def allowed(j):
+                r, c = divmod(j, cols)
+                return (r // size, c // size) in corridor
+            dist, parent = _local_search(successors, start, goal, allowed)
+            self.touched.update(dist)
+            path = _unwind(parent, goal)
+        else:
+            path = [start]
+            for u, v in zip(nodes, nodes[1:]):
+                if self.cluster(u) != self.cluster(v):
+                    path.append(v)  # a transition between clusters
+                    continue
+                dist, parent = _local_search(successors, u, v, self._in_cluster(self.cluster(u)))
+                self.touched.update(dist)
+                path.extend(_unwind(parent, v)[1:])
+        cost = self._path_cost(path)
+
+        optimal = gap = None
+        if self.exact:
+            dist, _ = _local_search(successors, start, goal)
+            optimal = dist[goal]
+            gap = cost - optimal
+        states = [problem.from_index(i) for i in path]
+        self.result = HPAResult(cost, states, abstract_cost, optimal, gap)
+        if costlimit is not None and cost > costlimit:
+            return False
+        return TNode(cost, cost, 0, goalstate, None)
+
+    def list_of_states(self, treenode):
+        """The Path of states found by the last search()."""
+        return Path(self.result.states)
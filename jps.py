@@ -0,0 +1,317 @@
+"""
+    Jump Point Search for GridProblem.
+
+    GridProblem edges cost the average of the two cells they join, so in
+    a region of identical cell weights every edge costs the same and A*
+    expands whole plateaus of equivalent states.  JumpPointSearch only
+    expands the states where a canonical path can change direction.
+
+    A cell is *interior* when all of its neighbours share its weight;
+    every edge touching an interior cell costs that weight.  Jumps move
+    in straight lines over interior cells only.  Any other cell (a weight
+    boundary) and the goal end a jump and are expanded in all four
+    directions, which is ordinary A* expansion.  Inside the uniform
+    regions the 4-connected pruning rules apply: moves along a row keep
+    going along the row, and moves along a column keep going and also
+    branch along the row.  A column move therefore stops at a cell whose
+    row scan finds a jump point.  Row scans use precomputed run lengths
+    of interior cells (as in JPS+), so each one is O(1).
+
+    Run as a script to benchmark against AStar:
+
+    > python jps.py --size 200 --rectangles 40
+"""
+
+from heapq import heappush, heappop
+import math
+import time
+import random
+from array import array
+from astar import TNode, IndexedReached
+
+
+class JumpPointSearch():
+    """Jump Point Search over a GridProblem, returning the same path
+    costs as AStar.search.  States, search() and list_of_states() follow
+    the GridAStar conventions, except that search() takes an explicit
+    goal state because jumps check for the goal inside runs of cells."""
+
+    # Moves as (row step, column step); index 0 is reserved for
+    # "no incoming direction" (the initial state).
+    MOVES = (None, (-1, 0), (1, 0), (0, -1), (0, 1))
+
+    def __init__(self, problem):
+        self.problem = problem
+        grid = problem.grid
+        self.rows = rows = len(grid)
+        self.cols = cols = len(grid[0])
+        self.weights = weights = [w for row in grid for w in row]
+        n = rows * cols
+
+        interior = bytearray(n)
+        for i in range(n):
+            r, c = divmod(i, cols)
+            w = weights[i]
+            interior[i] = ((r == 0 or weights[i-cols] == w) and
+                           (r == rows-1 or weights[i+cols] == w) and
+                           (c == 0 or weights[i-1] == w) and
+                           (c == cols-1 or weights[i+1] == w))
+        self.interior = interior
+
+        # run_left[i] / run_right[i]: number of interior cells following
+        # interior cell i along its row, i.e. the precomputed jump distance.
+        run_left = array('l', [0]) * n
+        run_right = array('l', [0]) * n
+        for r in range(rows):
+            base = r * cols
+            for c in range(1, cols):
+                i = base + c
+                if interior[i] and interior[i-1]:
+                    run_left[i] = run_left[i-1] + 1
+            for c in range(cols-2, -1, -1):
+                i = base + c
+                if interior[i] and interior[i+1]:
+                    run_right[i] = run_right[i+1] + 1
+        self.runs = {-1: run_left, 1: run_right}
+
+        self.g = array('d', [math.inf]) * n
+        self.f = array('d', [math.inf]) * n
+        self.parent = array('q', [-1]) * n
+        self.direction = bytearray(n)
+        self.touched = []
+        self.frontier = []
+        self.expansions = 0
+        self.stale_pops = 0
+        self.reached = IndexedReached(self)
+
+    def is_reached(self, index):
+        """True iff the jump point with the given index has been reached."""
+        return self.g[index] < math.inf
+
+    def reset(self):
+        """Forget the previous search, keeping the run length tables.
+        Only the entries it touched are restored, as GridAStar.reset()."""
+        g, f, parent, direction = self.g, self.f, self.parent, self.direction
+        inf = math.inf
+        for i in self.touched:
+            g[i] = inf
+            f[i] = inf
+            parent[i] = -1
+            direction[i] = 0
+        self.touched.clear()
+        self.frontier.clear()
+        self.expansions = 0
+        self.stale_pops = 0
+
+    def _jump_row(self, n, dc, goal):
+        """Jump from cell n along its row in direction dc (+1 or -1).
+        Returns (jump point, cost) or None if the jump leaves the grid."""
+        cols = self.cols
+        c = n % cols + dc
+        if c < 0 or c >= cols:
+            return None
+        x = n + dc
+        weights = self.weights
+        cost = (weights[n] + weights[x]) / 2.0
+        if x == goal or not self.interior[x]:
+            return x, cost
+        w = weights[x]
+        if not self.interior[n] and self._forced(n, w):
+            return x, cost
+        run = self.runs[dc][x]
+        if goal // cols == x // cols:
+            steps = (goal - x) * dc
+            if 0 < steps <= run:
+                return goal, cost + steps * w
+        if 0 <= c + (run+1) * dc < cols:
+            return x + (run+1) * dc, cost + (run+1) * w
+        return None
+
+    def _forced(self, n, w):
+        """True iff a row move out of cell n into a cell of weight w has a
+        forced neighbour: a cell above or below n of a different weight,
+        which the pruned (column first) paths would wrongly route
+        through."""
+        cols = self.cols
+        weights = self.weights
+        return ((n >= cols and weights[n-cols] != w) or
+                (n + cols < len(weights) and weights[n+cols] != w))
+
+    def _jump_column(self, n, dr, goal):
+        """Jump from cell n along its column in direction dr (+1 or -1).
+        Returns (jump point, cost) or None if the jump leaves the grid."""
+        r = n // self.cols + dr
+        if r < 0 or r >= self.rows:
+            return None
+        step = dr * self.cols
+        weights = self.weights
+        interior = self.interior
+        x = n + step
+        cost = (weights[n] + weights[x]) / 2.0
+        while True:
+            if x == goal or not interior[x]:
+                return x, cost
+            if self._jump_row(x, 1, goal) or self._jump_row(x, -1, goal):
+                return x, cost
+            r += dr
+            if r < 0 or r >= self.rows:
+                return None
+            x += step
+            cost += weights[x]
+
+    def search(self, initialstate, goalstate, costlimit=None, quiet=True):
+        """Performs Jump Point Search from initialstate to goalstate.
+        The problem's is_goal is not used; its heuristic is.
+
+        Returns a TNode for goalstate (with parent None; use
+        list_of_states() to recover the path), or False if the search
+        failed.
+        """
+        self.reset()
+        problem = self.problem
+        h = problem.h
+        from_index = problem.from_index
+        g = self.g
+        fscore = self.f
+        parent = self.parent
+        direction = self.direction
+        interior = self.interior
+        frontier = self.frontier
+        touched = self.touched
+        inf = math.inf
+
+        start = problem.to_index(initialstate)
+        goal = problem.to_index(goalstate)
+        g[start] = 0
+        fscore[start] = h(initialstate)
+        parent[start] = -1
+        direction[start] = 0
+        touched.append(start)
+        heappush(frontier, (fscore[start], start))
+
+        while frontier:
+            f, i = heappop(frontier)
+            # Skipping entries superseded by a cheaper path
+            if f > fscore[i]:
+                self.stale_pops += 1
+                continue
+            gi = g[i]
+            if costlimit is not None and gi > costlimit:
+                return False
+            if i == goal:
+                state = from_index(i)
+                return TNode(f, gi, h(state), state, None)
+            self.expansions += 1
+
+            d = direction[i]
+            if d == 0 or not interior[i]:
+                moves = (1, 2, 3, 4)
+            elif d <= 2:
+                moves = (d, 3, 4)
+            elif self._forced(i - self.MOVES[d][1], self.weights[i]):
+                moves = (d, 1, 2)
+            else:
+                moves = (d,)
+
+            for move in moves:
+                dr, dc = self.MOVES[move]
+                if dr:
+                    jump = self._jump_column(i, dr, goal)
+                else:
+                    jump = self._jump_row(i, dc, goal)
+                if jump is None:
+                    continue
+                j, cost = jump
+                path_cost = gi + cost
+                if path_cost < g[j]:
+                    if g[j] == inf:
+                        touched.append(j)
+                    g[j] = path_cost
+                    parent[j] = i
+                    direction[j] = move
+                    fj = path_cost + h(from_index(j))
+                    fscore[j] = fj
+                    heappush(frontier, (fj, j))
+
+        return False
+
+    def list_of_states(self, treenode):
+        """Given the TNode returned by search(), return the Path of every
+        state from the initial state, filling in the cells jumped over
+        between consecutive jump points."""
+        parent = self.parent
+        cols = self.cols
+        indices = array('l')
+        i = self.problem.to_index(treenode.state)
+        while parent[i] != -1:
+            p = parent[i]
+            step = (cols if abs(i - p) >= cols else 1) * (1 if i > p else -1)
+            indices.extend(range(i, p, -step))
+            i = p
+        indices.append(i)
+        indices.reverse()
+        return self.problem.path_from_indices(indices)
+
+
+def plateau_grid(size, rectangles, weights=(1, 2, 5, 10), seed=0):
+    """Returns a size x size list-of-lists grid made of uniform weight
+    rectangles painted over a weight 1 background."""
+    rng = random.Random(seed)
+    grid = [[1] * size for _ in range(size)]
+    for _ in range(rectangles):
+        r0, c0 = rng.randrange(size), rng.randrange(size)
+        r1 = min(size, r0 + rng.randrange(1, max(2, size // 3)))
+        c1 = min(size, c0 + rng.randrange(1, max(2, size // 3)))
+        w = rng.choice(weights)
+        for r in range(r0, r1):
+            grid[r][c0:c1] = [w] * (c1 - c0)
+    return grid
+
+
+def benchmark(grid, start, goal):
+    """Runs AStar and JumpPointSearch on grid from start to goal with the
+    (admissible) Manhattan heuristic scaled by the smallest weight.
+    Returns a dict of path cost, expansions and seconds per engine."""
+    import astar
+
+    wmin = min(min(row) for row in grid)
+
+    def h(s):
+        return wmin * (abs(s[0] - goal[0]) + abs(s[1] - goal[1]))
+
+    results = {}
+    prob = astar.GridProblem(grid, goaltest=lambda x: x == goal, hfn=h)
+    a = astar.AStar(prob)
+    t0 = time.perf_counter()
+    node = a.search(start)
+    t1 = time.perf_counter()
+    results['astar'] = {'cost': node.g,
+                        'expansions': len(a.closed) + a.reexpansions,
+                        'seconds': t1 - t0}
+
+    t0 = time.perf_counter()
+    j = JumpPointSearch(prob)
+    t1 = time.perf_counter()
+    node = j.search(start, goal)
+    t2 = time.perf_counter()
+    results['jps'] = {'cost': node.g,
+                      'expansions': j.expansions,
+                      'seconds': t2 - t1,
+                      'preprocess_seconds': t1 - t0}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark JumpPointSearch against AStar")
+    parser.add_argument('--size', type=int, default=200)
+    parser.add_argument('--rectangles', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grid = plateau_grid(args.size, args.rectangles, seed=args.seed)
+    results = benchmark(grid, (0, 0), (args.size - 1, args.size - 1))
+    for engine, r in results.items():
+        print("%-6s cost %.2f  %7d expansions  %.3f seconds" %
+              (engine, r['cost'], r['expansions'], r['seconds']))
@@ -0,0 +1,144 @@
+"""
+    Landmark (ALT) heuristics for GridProblem and ImageProblem.
+
+    A few landmark states are picked and the exact distance from each one
+    to every state is computed once with Dijkstra's algorithm.  Edge
+    costs are symmetric, so by the triangle inequality
+
+        h(s) = max over landmarks L of |d(L, goal) - d(L, s)|
+
+    never overestimates the distance from s to the goal, and it is also
+    consistent.  It is usually far tighter than h = 0 or the Chebyshev
+    distance, so repeated queries on the same map expand far fewer
+    states.  The tables can be saved to a .npy file (or a MapCache) and
+    loaded again, memory mapped, by later runs.  A .npy file is saved
+    with a PATH.key file identifying its map, and is only loaded for
+    that map: tables of another map would make h inadmissible.
+
+    > python astar.py 80x80-0.png --landmarks 8 --landmark-file 80x80.npy
+    > python astar.py 80x80-0.png --landmarks 8 --cache-dir ~/.cache/astar
+"""
+
+from heapq import heappush, heappop
+import hashlib
+import math
+from array import array
+import numpy as np
+import mapcache
+
+
+def dijkstra(problem, source):
+    """Exact distances from the state with index source to every state
+    of a problem providing the index_successors() interface.  Returns an
+    array('d') indexed like the problem's states (math.inf where
+    unreachable)."""
+    successors = problem.index_successors
+    dist = array('d', [math.inf]) * problem.num_states()
+    dist[source] = 0.0
+    frontier = [(0.0, source)]
+    while frontier:
+        d, i = heappop(frontier)
+        if d > dist[i]:
+            continue
+        for j, cost in successors(i):
+            nd = d + cost
+            if nd < dist[j]:
+                dist[j] = nd
+                heappush(frontier, (nd, j))
+    return dist
+
+
+def map_key(problem):
+    """A hash identifying the map of problem: mapcache.image_key() of its
+    image or .tiles file, else a hash of its grid or cost planes."""
+    path = getattr(problem, 'imagepth', None) or getattr(problem, 'tilespth', None)
+    if path:
+        return mapcache.image_key(path)
+    digest = hashlib.sha256()
+    if hasattr(problem, 'grid'):
+        digest.update(repr(problem.grid).encode())
+    else:
+        for plane in problem.costs:
+            digest.update(np.asarray(plane, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class Landmarks():
+    """Distance tables from a set of landmarks, and the ALT heuristics
+    built from them."""
+
+    def __init__(self, problem, tables):
+        """Wrap already computed tables: a (landmarks x states) float
+        array, as made by build() or load()."""
+        if tables.shape[1] != problem.num_states():
+            raise ValueError("landmark tables cover %d states, the problem has %d" %
+                             (tables.shape[1], problem.num_states()))
+        self.problem = problem
+        self.tables = tables
+        # memoryview indexing returns plain floats, much faster than
+        # indexing the numpy rows one element at a time.
+        self.rows = [memoryview(np.ascontiguousarray(t)) for t in tables]
+        self.landmarks = [int(i) for i in np.argmin(tables, axis=1)]
+
+    @classmethod
+    def build(cls, problem, count=8, first=0):
+        """Pick count landmarks by farthest point selection and compute
+        their distance tables.  The first landmark is the state farthest
+        from the state with index first; each later one is the state
+        farthest from all landmarks chosen so far."""
+        nearest = np.frombuffer(dijkstra(problem, first), dtype=np.float64)
+        tables = []
+        for _ in range(count):
+            landmark = int(np.argmax(np.where(np.isfinite(nearest), nearest, -1)))
+            dist = np.frombuffer(dijkstra(problem, landmark), dtype=np.float64)
+            nearest = dist if not tables else np.minimum(nearest, dist)
+            tables.append(dist)
+        return cls(problem, np.array(tables))
+
+    @classmethod
+    def cached(cls, problem, cache, count=8):
+        """Tables for an ImageProblem from a mapcache.MapCache, built and
+        stored there on a miss."""
+        key = cache.image_key(problem.imagepth)
+        tables = cache.get_or_build(key, 'alt%d' % count,
+                                    lambda: cls.build(problem, count).tables)
+        return cls(problem, tables)
+
+    @classmethod
+    def load(cls, problem, path):
+        """Load tables saved by save(), memory mapped rather than read.
+        ValueError if they were built for another map."""
+        try:
+            with open(path + '.key') as f:
+                key = f.read().strip()
+        except FileNotFoundError:
+            raise ValueError("%s has no %s.key naming its map" % (path, path))
+        if key != map_key(problem):
+            raise ValueError("%s holds landmark tables of a different map" % path)
+        return cls(problem, np.load(path, mmap_mode='r'))
+
+    def save(self, path):
+        """Save the tables as the .npy file path, and the key of their
+        map as path.key."""
+        np.save(path, np.asarray(self.tables))
+        with open(path + '.key', 'w') as f:
+            f.write(map_key(self.problem) + '\n')
+
+    def heuristic(self, goal):
+        """Returns the ALT heuristic function for the given goal state.
+        This is a heuristic factory, usable with batch.BatchSearch."""
+        to_index = self.problem.to_index
+        gi = to_index(goal)
+        pairs = [(row, row[gi]) for row in self.rows]
+
+        def h(state):
+            i = to_index(state)
+            best = 0
+            for row, dgoal in pairs:
+                d = row[i] - dgoal
+                if d < 0:
+                    d = -d
+                if d > best:
+                    best = d
+            return best
+        return h
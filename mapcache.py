@@ -0,0 +1,107 @@
+"""
+    Persistent on-disk cache of map preprocessing.
+
+    Decoding an image and building its cost planes, landmark tables and
+    so on is repeated by every run of astar.py.  A MapCache keeps those
+    artifacts as .npy files in a directory.  Later processes memory map
+    the files instead of recomputing them, so a known map starts almost
+    instantly.
+
+    Entries are keyed by a hash of the image bytes and
+    astar.COST_VERSION, so editing the image or changing the cost
+    function never serves a stale entry.  The directory is kept under a
+    size bound by evicting the least recently used files.
+
+    > python astar.py 80x80-0.png --cache-dir ~/.cache/astar
+"""
+
+import hashlib
+import os
+import numpy as np
+from astar import COST_VERSION
+
+
+def image_key(imagepth, *parts):
+    """Key for artifacts derived from the image at imagepth: a hash of
+    its bytes, COST_VERSION and any extra parts."""
+    digest = hashlib.sha256()
+    with open(imagepth, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(("|%d" % COST_VERSION).encode())
+    for part in parts:
+        digest.update(("|%s" % (part,)).encode())
+    return digest.hexdigest()
+
+
+class MapCache():
+    """A size bounded directory of memory mappable .npy artifacts."""
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def image_key(self, imagepth, *parts):
+        """Key for artifacts derived from the image at imagepth; see
+        image_key()."""
+        return image_key(imagepth, *parts)
+
+    def path(self, key, name):
+        """File name of the artifact called name under key."""
+        return os.path.join(self.directory, "%s-%s.npy" % (key, name))
+
+    def load(self, key, name):
+        """Memory map a cached artifact, or return None on a miss."""
+        path = self.path(key, name)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)  # the mtime records the last use for eviction
+        self.hits += 1
+        return array
+
+    def store(self, key, name, array):
+        """Write an artifact (atomically, so concurrent readers never see
+        a partial file), evict old entries, and return the artifact
+        memory mapped from its file."""
+        path = self.path(key, name)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def get_or_build(self, key, name, build):
+        """Return the cached artifact, or call build() to make it, store
+        it and return it."""
+        array = self.load(key, name)
+        if array is None:
+            array = self.store(key, name, build())
+        return array
+
+    def size(self):
+        """Total bytes of the cached artifacts."""
+        return sum(os.path.getsize(p) for p in self._entries())
+
+    def evict(self, keep=None):
+        """Delete least recently used artifacts until the cache is within
+        max_bytes.  The artifact at path keep is never deleted."""
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        total = sum(os.path.getsize(p) for p in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def _entries(self):
+        return [os.path.join(self.directory, f)
+                for f in os.listdir(self.directory) if f.endswith('.npy')]
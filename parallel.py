@@ -0,0 +1,122 @@
+"""
+    Parallel execution of independent path queries.
+
+    AStar search is pure Python, so one process keeps one core busy.  A
+    ParallelRunner fans a batch of start/goal queries out to a pool of
+    worker processes.  The map (an ImageProblem's cost planes, or a
+    GridProblem's weights) is copied once into a shared memory block.
+    Each worker attaches to that block when it starts and wraps it in a
+    problem without copying, so the map is never pickled per task.
+    Results come back in input order.
+
+    From the command line:
+
+    > python astar.py 80x80-0.png --queries queries.txt --workers 8
+"""
+
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from astar import GridProblem, ImageProblem
+from batch import BatchSearch, zero_heuristic
+
+# Set in each worker process by _init_worker.
+_worker = None
+
+
+def share_problem(problem):
+    """Copy the map of a GridProblem or ImageProblem into a new shared
+    memory block.  Returns (shm, spec), where spec is a picklable
+    description that attach_problem() turns back into a problem."""
+    # Duck typed rather than isinstance(): the CLI runs astar as __main__,
+    # so its problems are not instances of the imported astar classes.
+    if not hasattr(problem, 'grid'):
+        problem.precompute()
+        n = problem.num_states()
+        shm = shared_memory.SharedMemory(create=True, size=4 * n * 8)
+        for k, plane in enumerate(problem.costs):
+            shm.buf[k*n*8:(k+1)*n*8] = memoryview(plane).cast('B')
+        spec = ('image', shm.name, problem.width, problem.height)
+    else:
+        rows, cols = len(problem.grid), len(problem.grid[0])
+        weights = array('d', (w for row in problem.grid for w in row))
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(weights) * 8))
+        shm.buf[:len(weights)*8] = memoryview(weights).cast('B')
+        spec = ('grid', shm.name, rows, cols)
+    return shm, spec
+
+
+def attach_problem(spec):
+    """Attach to the shared memory block described by spec (as returned
+    by share_problem()) and wrap it in a problem without copying.
+    Returns (shm, problem); keep shm alive as long as problem is used."""
+    kind, name, a, b = spec
+    shm = shared_memory.SharedMemory(name=name)
+    values = shm.buf.cast('d')
+    if kind == 'image':
+        n = a * b
+        costs = [values[k*n:(k+1)*n] for k in range(4)]
+        problem = ImageProblem.from_costs(a, b, costs)
+    else:
+        problem = GridProblem([values[r*b:(r+1)*b] for r in range(a)])
+    return shm, problem
+
+
+def _init_worker(spec, hfactory, consistent):
+    global _worker
+    shm, problem = attach_problem(spec)
+    _worker = (shm, BatchSearch(problem, hfactory, consistent=consistent))
+
+
+def _solve(query):
+    return _worker[1].run(*query)
+
+
+class ParallelRunner():
+    """Runs batches of start/goal queries on a process pool."""
+
+    def __init__(self, problem, workers=None, hfactory=zero_heuristic,
+                 consistent=False):
+        """Arguments:
+            problem:   the GridProblem or ImageProblem to query
+            workers:   number of worker processes (default: one per core)
+            hfactory:  a picklable heuristic factory, as for BatchSearch
+            consistent: passed on to GridAStar
+        """
+        self.workers = workers or os.cpu_count()
+        self.shm, spec = share_problem(problem)
+        self.executor = ProcessPoolExecutor(self.workers,
+                                            initializer=_init_worker,
+                                            initargs=(spec, hfactory, consistent))
+        self.queries = 0
+        self.seconds = 0.0
+
+    def run(self, queries, chunksize=None):
+        """Answer a batch of (start, goal) queries, returning a list of
+        QueryResults in input order."""
+        queries = list(queries)
+        if chunksize is None:
+            chunksize = max(1, len(queries) // (4 * self.workers))
+        start = time.perf_counter()
+        results = list(self.executor.map(_solve, queries, chunksize=chunksize))
+        self.seconds += time.perf_counter() - start
+        self.queries += len(queries)
+        return results
+
+    def throughput(self):
+        """Aggregate queries per second over all run() calls so far."""
+        return self.queries / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        """Shut the pool down and release the shared memory."""
+        self.executor.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
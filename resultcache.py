@@ -0,0 +1,123 @@
+"""
+    A bounded LRU cache of path query results.
+
+    Repeated start/goal queries against the same map are answered from
+    the cache instead of searching again.  Because every subpath of an
+    optimal path is itself optimal (and edge costs are symmetric), a
+    cached path from s to t also answers any query between two states on
+    it, in either direction.  The cost of such a subpath is the
+    difference of the path's prefix costs.  Paths are kept as compact
+    astar.Paths, and subpaths are slices sharing their memory.
+
+    Entries are keyed by a map key (the map's identity and the
+    heuristic) and carry the map's version.  A problem whose costs can
+    change has a version attribute that is bumped on every change.  A
+    lookup with a newer version drops every entry of that map.
+
+    > python astar.py 80x80-0.png --queries queries.txt --result-cache 4096
+"""
+
+from collections import OrderedDict
+from astar import Path
+from batch import QueryResult
+
+
+class ResultCache():
+    """LRU cache of QueryResults with prefix costs, for one or more maps."""
+
+    def __init__(self, max_entries=1024, subpaths=True):
+        """Arguments:
+            max_entries: most paths kept before the least recently used
+                           is evicted
+            subpaths:    also answer queries between two states on a
+                           cached path.  Only valid if the cached paths
+                           are optimal, i.e. the heuristic is admissible.
+        """
+        self.max_entries = max_entries
+        self.subpaths = subpaths
+        self.entries = OrderedDict()  # (map key, start, goal) -> (Path, prefix)
+        self.index = {}               # map key -> {state: keys of paths through it}
+        self.versions = {}            # map key -> version of the cached entries
+        self.hits = 0
+        self.subpath_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self, map_key, version):
+        if self.versions.get(map_key, version) != version:
+            self.invalidate(map_key)
+        self.versions[map_key] = version
+
+    def get(self, map_key, start, goal, version=0):
+        """A QueryResult for the query, or None on a miss."""
+        self._check_version(map_key, version)
+        key = (map_key, start, goal)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            states, prefix = entry
+            return QueryResult(start, goal, prefix[-1] if states else None, states)
+
+        through = self.index.get(map_key, {}) if self.subpaths else {}
+        if start in through and goal in through:
+            key = next(iter(through[start] & through[goal]), None)
+            if key is not None:
+                self.entries.move_to_end(key)
+                self.subpath_hits += 1
+                states, prefix = self.entries[key]
+                i = states.index(start)
+                j = states.index(goal)
+                if i <= j:
+                    return QueryResult(start, goal, prefix[j] - prefix[i], states[i:j + 1])
+                return QueryResult(start, goal, prefix[i] - prefix[j], states[j:i + 1][::-1])
+        self.misses += 1
+        return None
+
+    def put(self, map_key, result, prefix, version=0):
+        """Cache a QueryResult.  prefix[k] is the cost of the path up to
+        result.states[k] (ignored, and may be empty, if there is no path)."""
+        self._check_version(map_key, version)
+        key = (map_key, result.start, result.goal)
+        if key in self.entries:
+            self._remove(key)
+        states = Path(result.states)  # shares a Path's memory rather than copying it
+        self.entries[key] = (states, prefix)
+        if states and self.subpaths:
+            through = self.index.setdefault(map_key, {})
+            for state in states:
+                through.setdefault(state, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        states, _ = self.entries.pop(key)
+        through = self.index.get(key[0])
+        if through is not None and self.subpaths:
+            for state in states:
+                keys = through.get(state)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del through[state]
+
+    def invalidate(self, map_key=None):
+        """Drop every entry for map_key (for all maps if None)."""
+        for key in [k for k in self.entries if map_key is None or k[0] == map_key]:
+            del self.entries[key]
+        if map_key is None:
+            self.index.clear()
+            self.versions.clear()
+        else:
+            self.index.pop(map_key, None)
+            self.versions.pop(map_key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Hit/miss counters and the number of cached paths, as a dict."""
+        return {'entries': len(self.entries), 'hits': self.hits,
+                'subpath_hits': self.subpath_hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,352 @@
+"""
+    An asyncio server answering path queries as JSON lines.
+
+    Maps are loaded once at startup and kept in memory.  Searches run on
+    a bounded pool of worker processes that share the maps (see
+    parallel.py), so the event loop itself never blocks on a search.
+    Each request line is
+
+        {"id": 1, "map": "big", "start": [0, 0], "goal": [79, 79], "path": true}
+
+    and is answered, possibly out of order, by
+
+        {"id": 1, "cost": 120.5, "length": 91, "path": [[0, 0], ...]}
+
+    ("cost" is null when there is no path, "path" is only sent when
+    asked for, and a bad request gets {"id": ..., "error": "..."}).  The
+    request {"op": "info"} lists the maps and their state bounds.
+
+    At most max_pending requests are in flight at a time; beyond that
+    the server stops reading, so clients are slowed down by TCP (or pipe)
+    backpressure instead of the server queueing without bound.  Identical
+    queries that arrive while one is being searched share its result.
+
+    > python server.py serve --map img=80x80-0.png --map grid=grid --port 8440
+    > python server.py serve --map img=80x80-0.png < requests.jsonl
+    > python server.py load --port 8440 --map img --count 2000 --concurrency 32
+
+    The load generator reports throughput and p50/p95/p99 latency.
+"""
+
+import asyncio
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from batch import BatchSearch, zero_heuristic
+from parallel import attach_problem, share_problem
+
+# Set in each worker by _init_worker or _use_searches: map name -> (shm, BatchSearch).
+_searches = None
+
+
+def _init_worker(specs, hfactory):
+    global _searches
+    _searches = {}
+    for name, spec in specs.items():
+        shm, problem = attach_problem(spec)
+        _searches[name] = (shm, BatchSearch(problem, hfactory))
+
+
+def _use_searches(searches):
+    global _searches
+    _searches = searches
+
+
+def _solve(name, start, goal):
+    return _searches[name][1].run(start, goal)
+
+
+def state_bounds(problem):
+    """Exclusive upper bounds of the two state coordinates of a
+    GridProblem ((rows, cols)) or ImageProblem ((width, height))."""
+    if hasattr(problem, 'grid'):
+        return len(problem.grid), len(problem.grid[0])
+    return problem.width, problem.height
+
+
+def load_map(path):
+    """A problem for the --map argument path: 'grid' for the default
+    GridProblem, anything else is an image."""
+    import astar
+
+    if path == 'grid':
+        return astar.GridProblem()
+    return astar.ImageProblem(path, None, precompute=True)
+
+
+class PathServer():
+    """Serves queries against a fixed set of named maps."""
+
+    def __init__(self, maps, workers=None, max_pending=64, hfactory=zero_heuristic):
+        """Arguments:
+            maps:        dict of map name -> GridProblem or ImageProblem
+            workers:     number of worker processes (default: one per
+                           core), or 0 to search on a single thread in
+                           this process
+            max_pending: most requests in flight at once
+            hfactory:    a picklable heuristic factory, as for BatchSearch
+        """
+        self.bounds = {name: state_bounds(p) for name, p in maps.items()}
+        self.shms = []
+        if workers == 0:
+            searches = {name: (None, BatchSearch(p, hfactory)) for name, p in maps.items()}
+            self.executor = ThreadPoolExecutor(1, initializer=_use_searches,
+                                               initargs=(searches,))
+        else:
+            specs = {}
+            for name, problem in maps.items():
+                shm, specs[name] = share_problem(problem)
+                self.shms.append(shm)
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(specs, hfactory))
+        self.slots = asyncio.Semaphore(max_pending)
+        self.inflight = {}
+        self.answered = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _parse(self, request):
+        """Validate a query request; returns (map name, start, goal)."""
+        name = request.get('map')
+        if not isinstance(name, str) or name not in self.bounds:
+            raise ValueError("unknown map %r" % (name,))
+        bounds = self.bounds[name]
+        ends = []
+        for key in ('start', 'goal'):
+            try:
+                a, b = request[key]
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("%r must be a pair of coordinates" % key)
+            if not (type(a) is int and type(b) is int):  # not JSON true/false
+                raise ValueError("%r must be a pair of integer coordinates" % key)
+            if not (0 <= a < bounds[0] and 0 <= b < bounds[1]):
+                raise ValueError("%s %r is outside map %r" % (key, [a, b], name))
+            ends.append((a, b))
+        return name, ends[0], ends[1]
+
+    async def query(self, name, start, goal):
+        """Answer one query, returning a batch.QueryResult.  Concurrent
+        identical queries share one search."""
+        key = (name, start, goal)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, _solve, name, start, goal)
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self.inflight.pop(key, None))
+        # shielded, so one cancelled caller doesn't cancel the others
+        return await asyncio.shield(future)
+
+    async def answer(self, line):
+        """The response dict for one request line."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            request_id = request.get('id')
+            if request.get('op') == 'info':
+                return {'id': request_id,
+                        'maps': {name: list(b) for name, b in self.bounds.items()}}
+            name, start, goal = self._parse(request)
+        except ValueError as e:  # json.JSONDecodeError is a ValueError
+            self.errors += 1
+            return {'id': request_id, 'error': str(e)}
+        try:
+            result = await self.query(name, start, goal)
+        except Exception as e:  # e.g. a broken worker pool: still answer
+            self.errors += 1
+            return {'id': request_id, 'error': "search failed: %s" % (e,)}
+        if result.error is not None:
+            self.errors += 1
+            return {'id': request_id, 'error': result.error}
+        self.answered += 1
+        response = {'id': request_id, 'cost': result.cost, 'length': len(result.states)}
+        if request.get('path'):
+            response['path'] = [list(s) for s in result.states]
+        return response
+
+    async def serve(self, readline, write):
+        """Answer request lines until readline() returns an empty line.
+        readline and write are coroutine functions reading one line and
+        writing one line (without its newline)."""
+        tasks = set()
+
+        async def respond(line):
+            try:
+                await write(json.dumps(await self.answer(line)))
+            finally:
+                self.slots.release()
+
+        while True:
+            await self.slots.acquire()
+            line = await readline()
+            if not line:
+                self.slots.release()
+                break
+            if not line.strip():
+                self.slots.release()
+                continue
+            task = asyncio.ensure_future(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def serve_connection(self, reader, writer):
+        """asyncio.start_server callback: serve one TCP client."""
+        lock = asyncio.Lock()
+
+        async def write(text):
+            async with lock:
+                writer.write(text.encode() + b'\n')
+                await writer.drain()
+        try:
+            await self.serve(reader.readline, write)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_tcp(self, host='127.0.0.1', port=8440):
+        """Serve TCP clients until cancelled."""
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdio(self):
+        """Serve requests from stdin, writing responses to stdout."""
+        loop = asyncio.get_running_loop()
+
+        async def readline():
+            return await loop.run_in_executor(None, sys.stdin.readline)
+
+        async def write(text):
+            sys.stdout.write(text + '\n')
+            sys.stdout.flush()
+        await self.serve(readline, write)
+
+    def close(self):
+        """Shut the workers down and release the shared maps."""
+        self.executor.shutdown()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def percentile(values, p):
+    """The p-th percentile (nearest rank) of a non-empty list of values."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+async def load_test(host, port, name, count=1000, concurrency=16, repeat=0.2, seed=0):
+    """Send count random queries for map name over concurrency
+    connections, each waiting for a response before sending its next
+    query.  A fraction repeat of the queries repeats an earlier one.
+    Returns a dict of throughput and latency percentiles (in seconds)."""
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"op": "info"}\n')
+    bounds = json.loads(await reader.readline())['maps'][name]
+    writer.close()
+
+    queries = []
+    for _ in range(count):
+        if queries and rng.random() < repeat:
+            queries.append(rng.choice(queries))
+        else:
+            queries.append([[rng.randrange(bounds[0]), rng.randrange(bounds[1])]
+                            for _ in range(2)])
+    latencies = []
+    errors = 0
+
+    async def client(share):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        for k, (start, goal) in share:
+            sent = time.perf_counter()
+            writer.write(json.dumps({'id': k, 'map': name, 'start': start,
+                                     'goal': goal}).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent)
+            errors += 'error' in response
+        writer.close()
+
+    started = time.perf_counter()
+    numbered = list(enumerate(queries))
+    await asyncio.gather(*(client(numbered[c::concurrency]) for c in range(concurrency)))
+    seconds = time.perf_counter() - started
+    return {'queries': count, 'errors': errors, 'seconds': seconds,
+            'throughput': count / seconds,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JSON-lines path query server")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="load maps and answer queries")
+    serve.add_argument('--map', action='append', required=True, metavar='NAME=PATH',
+                       help="a map to serve: an image path, or 'grid' for the "
+                            "default GridProblem (repeatable)")
+    serve.add_argument('--port', type=int,
+                       help="listen on this TCP port (default: stdin/stdout)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--workers', type=int,
+                       help="worker processes (default one per core, 0 for "
+                            "a single in-process thread)")
+    serve.add_argument('--max-pending', type=int, default=64,
+                       help="most requests in flight before reading stops")
+    load = commands.add_parser('load', help="measure a running server")
+    load.add_argument('--host', default='127.0.0.1')
+    load.add_argument('--port', type=int, default=8440)
+    load.add_argument('--map', required=True, metavar='NAME')
+    load.add_argument('--count', type=int, default=1000)
+    load.add_argument('--concurrency', type=int, default=16)
+    load.add_argument('--repeat', type=float, default=0.2,
+                      help="fraction of queries repeating an earlier one")
+    load.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        report = asyncio.run(load_test(args.host, args.port, args.map, args.count,
+                                       args.concurrency, args.repeat, args.seed))
+        print("%(queries)d queries, %(errors)d errors in %(seconds).2f seconds "
+              "(%(throughput).1f queries/sec)" % report)
+        print("latency p50 %.1f ms, p95 %.1f ms, p99 %.1f ms" %
+              (report['p50'] * 1000, report['p95'] * 1000, report['p99'] * 1000))
+        sys.exit(0)
+
+    maps = {}
+    for entry in args.map:
+        name, sep, path = entry.partition('=')
+        if not sep:
+            parser.error("--map needs NAME=PATH, not %r" % entry)
+        maps[name] = load_map(path)
+
+    async def main():
+        with PathServer(maps, args.workers, args.max_pending) as server:
+            if args.port is None:
+                await server.serve_stdio()
+            else:
+                await server.serve_tcp(args.host, args.port)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
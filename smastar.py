@@ -0,0 +1,292 @@
+"""
+    Memory bounded A* (SMA*) for maps too large to keep every reached
+    state in memory.
+
+    The search never stores more than max_nodes search tree nodes.  When
+    it would, it first drops dead nodes (expanded, but with every
+    successor better reached elsewhere), then the worst leaf of the tree
+    (highest f, shallowest first), whose f value is backed up into its
+    parent.  The parent goes back on the frontier with the smallest f of
+    its forgotten children, so the forgotten part of the tree is
+    regenerated when it becomes the most promising again.  A node so
+    deep that its path can't fit within the cap gets f = inf.
+
+    Grids have very many equal cost paths, and a search that forgets
+    which states it has seen regenerates them over and over.  So a
+    dropped state leaves a record of its g and the f it had: it is only
+    generated again by a cheaper path, or by one as cheap if it was
+    dropped from the frontier (with its old f).  At most
+    records_per_node * max_nodes records are kept, those of the states
+    with the highest f being forgotten first (and counted in
+    stats.dropped), so memory is bounded by max_nodes whatever the size
+    of the map.  A search that reaches many more states than the records
+    can hold regenerates them over and over, and can take very long.
+
+    With a consistent heuristic the path found is optimal provided the
+    cap can hold it with a little room to spare.  With a smaller cap
+    the search sets truncated, and returns the best path it could fit
+    (not necessarily optimal) or False, instead of running out of
+    memory.  Either way stats.dropped and stats.regenerated report what
+    the cap cost.
+
+    > python astar.py 80x80-0.png --engine sma --max-nodes 2000 --records-per-node 8
+"""
+
+from heapq import heappush, heappop, heapify
+from collections import deque
+import math
+from astar import IndexedReached, SearchStats, TNode, path_from_parents
+
+# Fields of a stored node.
+G, F, PARENT, CHILDREN, DEPTH = range(5)
+
+
+class _Records(dict):
+    """Records of dropped states, index -> (g, f or None), holding at
+    most capacity of them.  set() evicts the records with the highest
+    rank (the f the state had) to make room and returns how many it
+    evicted."""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.capacity = capacity
+        self.rank = {}
+        self.worst = []  # (-rank, index), with superseded entries
+
+    def set(self, j, g, f, rank):
+        self[j] = (g, f)
+        self.rank[j] = rank
+        heappush(self.worst, (-rank, j))
+        evicted = 0
+        while len(self) > self.capacity:
+            negrank, k = heappop(self.worst)
+            if k in self and self.rank[k] == -negrank:
+                del self[k]
+                evicted += 1
+        if len(self.worst) > 2 * len(self) + 64:
+            rank = self.rank
+            self.worst = [(-rank[k], k) for k in self]
+            heapify(self.worst)
+        return evicted
+
+    def __delitem__(self, j):
+        super().__delitem__(j)
+        del self.rank[j]
+
+    def clear(self):
+        super().clear()
+        self.rank.clear()
+        self.worst.clear()
+
+
+class SMAStar():
+    """SMA* over a problem providing the index_successors() interface,
+    storing at most max_nodes search tree nodes."""
+
+    # records of dropped states kept per stored node
+    RECORDS_PER_NODE = 8
+
+    def __init__(self, problem, max_nodes=100000, records_per_node=RECORDS_PER_NODE):
+        """Arguments:
+            problem:          a GridProblem or ImageProblem
+            max_nodes:        most search tree nodes stored at once
+            records_per_node: most records of dropped states kept, per
+                                node of max_nodes
+        """
+        if max_nodes < 2:
+            raise ValueError("max_nodes must be at least 2, not %r" % (max_nodes,))
+        if records_per_node < 0:
+            raise ValueError("records_per_node must not be negative, not %r" % (records_per_node,))
+        self.problem = problem
+        self.max_nodes = max_nodes
+        self.records = _Records(records_per_node * max_nodes)
+        self.reached = IndexedReached(self)
+        self._clear()
+
+    def _clear(self):
+        self.nodes = {}        # index -> [g, f, parent, children, depth]
+        self.touched = self.nodes  # for IndexedReached
+        self.forgotten = {}    # index -> smallest f among its dropped children
+        self.open = set()
+        self.frontier = []     # (f, -depth, index): best first
+        self.worst = []        # (-f, depth, index): drop candidates first
+        self.dead = deque()    # closed childless nodes, dropped before leaves
+        self.root = self.expanding = -1
+        self.truncated = False
+        self.stats = SearchStats()
+        self.records.clear()
+
+    def is_reached(self, index):
+        """True iff the state with the given index is stored."""
+        return index in self.nodes
+
+    def _open(self, i, node):
+        self.open.add(i)
+        heappush(self.frontier, (node[F], -node[DEPTH], i))
+        heappush(self.worst, (-node[F], node[DEPTH], i))
+        self.stats.pushed += 1
+        if len(self.frontier) > 2 * len(self.open) + 64:
+            # too many superseded entries: rebuild the heaps
+            nodes = self.nodes
+            self.frontier = [(nodes[k][F], -nodes[k][DEPTH], k) for k in self.open]
+            self.worst = [(-nodes[k][F], nodes[k][DEPTH], k) for k in self.open]
+            heapify(self.frontier)
+            heapify(self.worst)
+
+    def _release(self, p):
+        """p lost a child.  If it was the last one, p becomes a drop
+        candidate: a leaf if it is on the frontier, else, if nothing
+        below it was forgotten (every successor is better reached
+        elsewhere), a dead node."""
+        if p == -1:
+            return
+        node = self.nodes[p]
+        node[CHILDREN] -= 1
+        if node[CHILDREN] or p == self.expanding:
+            return
+        if p in self.open:
+            heappush(self.worst, (-node[F], node[DEPTH], p))
+        elif p not in self.forgotten and p != self.root:
+            self.dead.append(p)
+
+    def _forget(self, w, f):
+        """Delete the childless node w.  Unless f is inf it is backed up
+        into the parent, which goes back on the frontier to regenerate
+        w when that looks most promising."""
+        node = self.nodes.pop(w)
+        self.stats.dropped += 1
+        p = node[PARENT]
+        if f < math.inf:
+            self.forgotten[p] = min(self.forgotten.get(p, math.inf), f)
+            evicted = self.records.set(w, node[G], f, f)
+        else:
+            evicted = self.records.set(w, node[G], None, node[F])
+        self.stats.dropped += evicted
+        self._release(p)
+        self._reopen(p)
+
+    def _reopen(self, p):
+        """Put p on the frontier with the smallest f of its forgotten
+        children, or lower its f if it is already there."""
+        f = self.forgotten.get(p)
+        if f is None or p == self.expanding:
+            return
+        node = self.nodes[p]
+        if p not in self.open or f < node[F]:
+            node[F] = f
+            self._open(p, node)
+
+    def _drop(self):
+        """Forget a dead node, or else the worst frontier leaf.  Returns
+        False if there is nothing to forget."""
+        nodes, open_, dead, worst = self.nodes, self.open, self.dead, self.worst
+        while dead:
+            w = dead.popleft()
+            node = nodes.get(w)
+            if node is not None and not node[CHILDREN] and w not in open_ \
+                    and w not in self.forgotten and w != self.expanding:
+                self._forget(w, math.inf)
+                return True
+        while worst:
+            negf, _, w = heappop(worst)
+            node = nodes.get(w)
+            if w in open_ and node[F] == -negf and not node[CHILDREN] and w != self.root:
+                open_.discard(w)
+                self._forget(w, node[F])
+                return True
+        return False
+
+    def _pop(self):
+        nodes, open_, frontier = self.nodes, self.open, self.frontier
+        while frontier:
+            f, _, i = heappop(frontier)
+            if i in open_ and nodes[i][F] == f:
+                return i
+            self.stats.stale_pops += 1
+        return -1
+
+    def search(self, initialstate, costlimit=None, quiet=True):
+        """Performs SMA* search from initialstate.
+
+        Arguments are as for AStar.search.  Returns a TNode for the goal
+        (with parent None; use list_of_states() to recover the path), or
+        False if the search failed.  If self.truncated is set afterwards,
+        paths were cut off by max_nodes, so False doesn't mean there is
+        no path and a path returned may not be optimal.
+        """
+        problem = self.problem
+        successors = problem.index_successors
+        from_index = problem.from_index
+        h = problem.h
+        is_goal = problem.is_goal
+        self._clear()
+        nodes, stats, records = self.nodes, self.stats, self.records
+        limit = self.max_nodes
+        self.root = root = problem.to_index(initialstate)
+        node = nodes[root] = [0.0, h(initialstate), -1, 0, 0]
+        self._open(root, node)
+
+        while True:
+            i = self._pop()
+            if i < 0:
+                return False
+            node = nodes[i]
+            gi, fi, depth = node[G], node[F], node[DEPTH]
+            if fi == math.inf:
+                return False
+            if costlimit is not None and gi > costlimit:
+                return False
+            state = from_index(i)
+            if is_goal(state):
+                return TNode(fi, gi, fi - gi, state, None)
+            self.open.discard(i)
+            self.expanding = i
+            stats.expanded += 1
+            self.forgotten.pop(i, None)  # all of them are regenerated now
+            for j, cost in successors(i):
+                gj = gi + cost
+                fj = 0.0
+                child = nodes.get(j)
+                if child is not None:
+                    if gj >= child[G]:
+                        continue
+                    # a cheaper path to a stored state: move it under i
+                    old_parent = child[PARENT]
+                    child[G], child[PARENT], child[DEPTH] = gj, i, depth + 1
+                    node[CHILDREN] += 1
+                    self._release(old_parent)
+                else:
+                    record = records.get(j)
+                    if record is not None:
+                        gr, fr = record
+                        if gj > gr or (gj == gr and fr is None):
+                            continue
+                        del records[j]
+                        if fr is not None:
+                            stats.regenerated += 1
+                            if gj == gr:
+                                fj = fr
+                    child = nodes[j] = [gj, 0.0, i, 0, depth + 1]
+                    node[CHILDREN] += 1
+                if depth + 2 >= limit and not is_goal(from_index(j)):
+                    child[F] = math.inf  # its path can never fit
+                    self.truncated = True
+                else:
+                    child[F] = max(gj + h(from_index(j)), fj)
+                self._open(j, child)
+                while len(nodes) > limit and self._drop():
+                    pass
+            self.expanding = -1
+            if len(self.open) > stats.max_frontier:
+                stats.max_frontier = len(self.open)
+            if i in self.forgotten:
+                self._reopen(i)  # children were dropped to make room
+            elif not node[CHILDREN] and i != root:
+                self.dead.append(i)
+
+    def list_of_states(self, treenode):
+        """Given a TNode returned by search(), return the Path of states
+        from the initial state to treenode's state."""
+        nodes = self.nodes
+        return path_from_parents(self.problem, lambda i: nodes[i][PARENT],
+                                 self.problem.to_index(treenode.state))
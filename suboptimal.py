@@ -0,0 +1,385 @@
+"""
+    Bounded-suboptimal search: paths guaranteed to cost at most a given
+    factor times the optimal cost, for far fewer expansions than A*.
+
+    WeightedAStar expands states in order of g + weight * h, so it heads
+    for the goal greedily and never expands a state twice.  FocalSearch
+    keeps A*'s frontier ordered by f = g + h, but expands, of the states
+    whose f is within weight times the smallest f (the focal list), the
+    one a second heuristic rates closest to the goal.  ARAStar (anytime
+    repairing A*) returns a weighted A* path first and then improves it:
+    every iteration lowers the weight and repairs the previous search,
+    re-expanding only the states whose g values improved, so each
+    tighter path costs a fraction of a fresh search.
+
+    The engines keep their latest result in self.result, a BoundedResult:
+    the goal TNode and the bound its path is guaranteed to be within of
+    the optimal cost.  The bound is the weight, tightened by the lower
+    bound on the optimal cost that the frontier gives when the path is
+    found.  WeightedAStar and ARAStar need a consistent heuristic for the
+    bound to hold, FocalSearch only an admissible one.
+
+    > python astar.py 80x80-0.png --engine ara --weight 3 --budget 0.05
+"""
+
+from heapq import heappush, heappop, heapify
+from collections import namedtuple
+from itertools import chain
+import math
+import time
+from array import array
+from astar import IndexedReached, SearchStats, TNode, path_from_parents
+
+# node: the goal TNode (with parent None); bound: the path costs at most
+# bound times the optimal cost (1.0: it is optimal); weight: the weight
+# of the search that found it; expanded: expansions made by the search
+# so far, over all ARA* iterations.
+BoundedResult = namedtuple('BoundedResult', ['node', 'bound', 'weight', 'expanded'])
+
+
+def _bound(cost, lower, weight):
+    """The suboptimality bound of a path of the given cost, found with
+    weight, when the optimal cost is known to be at least lower."""
+    if lower == math.inf or cost <= lower:
+        return 1.0
+    if lower <= 0:
+        return weight
+    return max(1.0, min(weight, cost / lower))
+
+
+class ARAStar():
+    """ARA* over a problem providing the index_successors() interface:
+    weighted A* searches with a falling weight, each reusing the work of
+    the last.  improve() yields every path found."""
+
+    def __init__(self, problem, weight=3.0, decrement=0.5, final_weight=1.0):
+        """Arguments:
+            problem:      a GridProblem or ImageProblem
+            weight:       the weight of the first iteration
+            decrement:    how much the weight is lowered after each path
+            final_weight: the weight of the last iteration (1.0: the
+                            last path is optimal)
+        """
+        if not 1.0 <= final_weight <= weight:
+            raise ValueError("weights must satisfy 1 <= final_weight <= weight")
+        if decrement <= 0 and weight > final_weight:
+            raise ValueError("decrement must be positive, not %r" % (decrement,))
+        self.problem = problem
+        self.weight = weight
+        self.decrement = decrement
+        self.final_weight = final_weight
+        n = problem.num_states()
+        self.g = array('d', [math.inf]) * n
+        self.hv = array('d', [0.0]) * n
+        self.parent = array('q', [-1]) * n
+        self.closed = bytearray(n)
+        self.touched = []
+        self.reached = IndexedReached(self)
+        self._clear()
+
+    def _clear(self):
+        g, parent, closed = self.g, self.parent, self.closed
+        for i in self.touched:
+            g[i] = math.inf
+            parent[i] = -1
+            closed[i] = 0
+        self.touched.clear()
+        self.goals = set()     # reached indices of goal states
+        self.goal = -1         # the cheapest of them
+        self.open = {}         # index -> its key on the frontier
+        self.frontier = []     # (g + weight * h, index)
+        self.incons = set()    # closed states whose g improved
+        self.stats = SearchStats()
+        self.result = None
+
+    def is_reached(self, index):
+        """True iff the state with the given index has been reached."""
+        return self.g[index] < math.inf
+
+    def _reach(self, j, gj, i, state, hj):
+        """Record the path of cost gj to j through i.  state and hj are
+        j's state and heuristic value, needed only the first time."""
+        if self.g[j] == math.inf:
+            self.touched.append(j)
+            self.hv[j] = hj
+            if self.problem.is_goal(state):
+                self.goals.add(j)
+        self.g[j] = gj
+        self.parent[j] = i
+        if j in self.goals and (self.goal < 0 or gj <= self.g[self.goal]):
+            self.goal = j
+
+    def _improve_path(self, weight, costlimit):
+        """Expand states in key order until the cheapest goal found so
+        far is no costlier than the smallest key."""
+        problem = self.problem
+        successors = problem.index_successors
+        from_index = problem.from_index
+        h = problem.h
+        g, hv, closed = self.g, self.hv, self.closed
+        open_, frontier, incons = self.open, self.frontier, self.incons
+        stats = self.stats
+        inf = math.inf
+        while frontier:
+            key, i = frontier[0]
+            if open_.get(i) != key:
+                heappop(frontier)
+                stats.stale_pops += 1
+                continue
+            if self.goal >= 0 and g[self.goal] <= key:
+                return
+            heappop(frontier)
+            del open_[i]
+            closed[i] = 1
+            stats.expanded += 1
+            gi = g[i]
+            for j, cost in successors(i):
+                gj = gi + cost
+                if gj >= g[j]:
+                    continue
+                state = None
+                if g[j] == inf:
+                    state = from_index(j)
+                    hj = h(state)
+                else:
+                    hj = hv[j]
+                if costlimit is not None and gj + hj > costlimit:
+                    continue
+                self._reach(j, gj, i, state, hj)
+                if closed[j]:
+                    incons.add(j)
+                else:
+                    open_[j] = key = gj + weight * hj
+                    heappush(frontier, (key, j))
+                    stats.pushed += 1
+            if len(open_) > stats.max_frontier:
+                stats.max_frontier = len(open_)
+
+    def improve(self, initialstate, costlimit=None):
+        """Run ARA* from initialstate, yielding a BoundedResult for every
+        path found: each is at least as cheap as the one before, with a
+        bound at least as tight.  Stops after the iteration with
+        final_weight, or as soon as the bound reaches final_weight.
+        Yields nothing if there is no path (of cost at most costlimit)."""
+        self._clear()
+        problem = self.problem
+        g, hv = self.g, self.hv
+        start = problem.to_index(initialstate)
+        self._reach(start, 0.0, -1, initialstate, problem.h(initialstate))
+        weight = self.weight
+        self.open[start] = hv[start] * weight
+        self.frontier.append((self.open[start], start))
+        self.stats.pushed += 1
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            self._improve_path(weight, costlimit)
+            self.stats.search_time += clock() - started
+            goal = self.goal
+            if goal < 0:
+                self.result = False
+                return
+            lower = min((g[i] + hv[i] for i in chain(self.open, self.incons)), default=math.inf)
+            state = problem.from_index(goal)
+            node = TNode(g[goal] + hv[goal], g[goal], hv[goal], state, None)
+            self.result = BoundedResult(node, _bound(g[goal], lower, weight), weight,
+                                        self.stats.expanded)
+            yield self.result
+            if weight <= self.final_weight or self.result.bound <= self.final_weight:
+                return
+            # reuse the search so far: requeue every open and
+            # inconsistent state under the lower weight
+            weight = max(self.final_weight, weight - self.decrement)
+            open_ = self.open
+            open_.update(dict.fromkeys(self.incons))
+            self.incons.clear()
+            for i in open_:
+                open_[i] = g[i] + weight * hv[i]
+            self.frontier = [(key, i) for i, key in open_.items()]
+            heapify(self.frontier)
+            closed = self.closed
+            for i in self.touched:
+                closed[i] = 0
+
+    def search(self, initialstate, costlimit=None, quiet=True, seconds=None):
+        """Performs ARA* search from initialstate.
+
+        Arguments are as for AStar.search, and seconds: if given, stop
+        improving the path once this many seconds have passed (the first
+        path is always found).  Returns a TNode for the goal of the best
+        path found (with parent None; use list_of_states() to recover the
+        path), or False if the search failed.  self.result holds its
+        bound.  With quiet=False every path found is reported.
+        """
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        result = False
+        for result in self.improve(initialstate, costlimit):
+            if not quiet:
+                print("weight %.2f: cost %.2f, within %.3f of optimal, %d expanded" %
+                      (result.weight, result.node.g, result.bound, result.expanded))
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return result.node if result else False
+
+    def list_of_states(self, treenode):
+        """Given a TNode returned by search(), return the Path of states
+        from the initial state to treenode's state."""
+        return path_from_parents(self.problem, self.parent.__getitem__,
+                                 self.problem.to_index(treenode.state))
+
+
+class WeightedAStar(ARAStar):
+    """Weighted A*: a single ARA* iteration, expanding states in order of
+    g + weight * h and never expanding a state twice.  The path costs at
+    most weight times the optimal cost."""
+
+    def __init__(self, problem, weight=2.0):
+        super().__init__(problem, weight, decrement=0.0, final_weight=weight)
+
+
+# States of FocalSearch.status.
+NEW, OPEN, CLOSED = range(3)
+
+
+class FocalSearch():
+    """Focal search over a problem providing the index_successors()
+    interface.  States are
+    re-opened when reached more cheaply, as in A*, so an admissible
+    heuristic is enough for the bound.  It pays off with an informed
+    focal_h: ranking the focal list by a weak h alone, on a map whose
+    costs are far above h, re-expands more states than A* does."""
+
+    def __init__(self, problem, weight=2.0, focal_h=None):
+        """Arguments:
+            problem:  a GridProblem or ImageProblem
+            weight:   the path costs at most weight times the optimal cost
+            focal_h:  a function of a state ranking the focal list (the
+                        smallest first), e.g. an inadmissible estimate of
+                        the distance to the goal.  None for the problem's h.
+        """
+        if weight < 1:
+            raise ValueError("weight must be at least 1, not %r" % (weight,))
+        self.problem = problem
+        self.weight = weight
+        self.focal_h = focal_h
+        n = problem.num_states()
+        self.g = array('d', [math.inf]) * n
+        self.f = array('d', [math.inf]) * n
+        self.dv = array('d', [0.0]) * n
+        self.parent = array('q', [-1]) * n
+        self.status = bytearray(n)
+        self.touched = []
+        self.reached = IndexedReached(self)
+        self.stats = SearchStats()
+        self.result = None
+
+    def is_reached(self, index):
+        """True iff the state with the given index has been reached."""
+        return self.g[index] < math.inf
+
+    def search(self, initialstate, costlimit=None, quiet=True):
+        """Performs focal search from initialstate.
+
+        Arguments are as for AStar.search.  Returns a TNode for the goal
+        (with parent None; use list_of_states() to recover the path), or
+        False if the search failed.  self.result holds its bound.
+        """
+        problem = self.problem
+        successors = problem.index_successors
+        from_index = problem.from_index
+        is_goal = problem.is_goal
+        h = problem.h
+        focal_h = self.focal_h
+        weight = self.weight
+        g, fscore, dv, parent, status = self.g, self.f, self.dv, self.parent, self.status
+        touched = self.touched
+        for i in touched:
+            g[i] = fscore[i] = math.inf
+            parent[i] = -1
+            status[i] = NEW
+        touched.clear()
+        self.stats = stats = SearchStats()
+        self.result = None
+        started = time.perf_counter()
+
+        opened = []   # (f, index): every open state, for the smallest f
+        focal = []    # (focal_h, f, index): open states with f <= weight * fmin
+        waiting = []  # (f, index): the other open states
+        start = problem.to_index(initialstate)
+        touched.append(start)
+        g[start] = 0.0
+        fscore[start] = h(initialstate)
+        dv[start] = focal_h(initialstate) if focal_h else fscore[start]
+        status[start] = OPEN
+        heappush(opened, (fscore[start], start))
+        heappush(focal, (dv[start], fscore[start], start))
+        stats.pushed += 1
+        try:
+            while True:
+                while opened and (status[opened[0][1]] != OPEN or
+                                  fscore[opened[0][1]] != opened[0][0]):
+                    heappop(opened)
+                    stats.stale_pops += 1
+                if not opened:
+                    self.result = False
+                    return False
+                fmin = opened[0][0]
+                limit = weight * fmin
+                while waiting and waiting[0][0] <= limit:
+                    f, i = heappop(waiting)
+                    if status[i] == OPEN and fscore[i] == f:
+                        heappush(focal, (dv[i], f, i))
+                while True:
+                    _, f, i = heappop(focal)
+                    if status[i] != OPEN or fscore[i] != f:
+                        stats.stale_pops += 1
+                    elif f > limit:
+                        heappush(waiting, (f, i))  # fmin fell since it was queued
+                    else:
+                        break
+                status[i] = CLOSED
+                gi = g[i]
+                state = from_index(i)
+                if is_goal(state):
+                    node = TNode(f, gi, f - gi, state, None)
+                    self.result = BoundedResult(node, _bound(gi, fmin, weight), weight,
+                                                stats.expanded)
+                    return node
+                stats.expanded += 1
+                for j, cost in successors(i):
+                    gj = gi + cost
+                    if gj >= g[j]:
+                        continue
+                    if g[j] == math.inf:
+                        state = from_index(j)
+                        hj = h(state)
+                        if costlimit is not None and gj + hj > costlimit:
+                            continue
+                        touched.append(j)
+                        dv[j] = focal_h(state) if focal_h else hj
+                    else:
+                        hj = fscore[j] - g[j]
+                        if costlimit is not None and gj + hj > costlimit:
+                            continue
+                        if status[j] == CLOSED:
+                            stats.reexpansions += 1
+                    g[j] = gj
+                    fscore[j] = fj = gj + hj
+                    parent[j] = i
+                    status[j] = OPEN
+                    heappush(opened, (fj, j))
+                    if fj <= limit:
+                        heappush(focal, (dv[j], fj, j))
+                    else:
+                        heappush(waiting, (fj, j))
+                    stats.pushed += 1
+                if len(opened) > stats.max_frontier:
+                    stats.max_frontier = len(opened)
+        finally:
+            stats.search_time += time.perf_counter() - started
+
+    def list_of_states(self, treenode):
+        """Given a TNode returned by search(), return the Path of states
+        from the initial state to treenode's state."""
+        return path_from_parents(self.problem, self.parent.__getitem__,
+                                 self.problem.to_index(treenode.state))
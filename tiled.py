@@ -0,0 +1,259 @@
+"""
+    Tiled, memory mapped image maps for rasters larger than memory.
+
+    A .tiles file holds the RGB pixels of an image as fixed size square
+    tiles (row major, the edge tiles padded) after a small header.  A
+    TiledImageProblem memory maps the file and pages tiles into a
+    bounded LRU cache as successors() touches them, so only the tiles
+    around the states a search reaches are ever read.  Edge costs are
+    computed from the pixels exactly as ImageProblem computes them.
+
+    Use it with the engines that only store the states they reach (AStar
+    with a good heuristic): the indexed engines allocate arrays over all
+    the states of the map.
+
+    > python tiled.py convert big.png big.tiles --tile 256
+    > python astar.py big.tiles -x 10 -y 10 --max-tiles 256
+"""
+
+import struct
+from collections import OrderedDict
+import numpy as np
+from astar import ImageProblem, Path, SearchProblem
+
+MAGIC = b'ASTARTIL'
+HEADER = struct.Struct('<8sQQQ')
+HEADER_BYTES = 64  # the header is padded to this, so tiles stay aligned
+
+
+class TiledImageProblem(SearchProblem):
+    """An ImageProblem over a .tiles file: the same states, successors
+    and edge costs, with pixels paged in a tile at a time."""
+
+    def __init__(self, tilespth, goaltest=None, hfn=None, max_tiles=64, mode='r'):
+        """Arguments:
+            tilespth:  a .tiles file, as written by convert() or create()
+            goaltest:  a function which takes a state and returns
+                         True iff the state satisifies the goaltest
+            hfn:       a heuristic function which takes a state
+                         and estimates the distance remaining to the goal.
+            max_tiles: most tiles held in memory at once
+            mode:      'r', or 'r+' to write pixels with write_rows()
+        """
+        with open(tilespth, 'rb') as f:
+            magic, width, height, tile = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a .tiles file" % tilespth)
+        self.tilespth = tilespth
+        self.width, self.height, self.tile = width, height, tile
+        self.tiles_x = -(-width // tile)
+        self.tiles_y = -(-height // tile)
+        self.tiles = np.memmap(tilespth, dtype=np.uint8, mode=mode, offset=HEADER_BYTES,
+                               shape=(self.tiles_y, self.tiles_x, tile, tile, 3))
+        self.is_goal = goaltest
+        self.h = hfn
+        self.max_tiles = max_tiles
+        self.cache = OrderedDict()  # tile number -> its pixels as bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def create(cls, tilespth, width, height, tile=256):
+        """Create an all black .tiles file (sparse where the file system
+        allows) and open it for write_rows()."""
+        tiles = -(-width // tile) * -(-height // tile)
+        with open(tilespth, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, width, height, tile).ljust(HEADER_BYTES, b'\0'))
+            f.truncate(HEADER_BYTES + tiles * tile * tile * 3)
+        return cls(tilespth, mode='r+')
+
+    @classmethod
+    def convert(cls, imagepth, tilespth, tile=256):
+        """Write the image at imagepth as a .tiles file, a strip of tiles
+        at a time.  PIL decodes the whole image, so for rasters larger
+        than memory use create() and write_rows() with a strip reader of
+        your own."""
+        import PIL.Image
+
+        image = PIL.Image.open(imagepth).convert('RGB')
+        prob = cls.create(tilespth, image.width, image.height, tile)
+        for y in range(0, image.height, tile):
+            strip = image.crop((0, y, image.width, min(y + tile, image.height)))
+            prob.write_rows(y, np.asarray(strip))
+        prob.tiles.flush()
+        return prob
+
+    def write_rows(self, y, pixels):
+        """Store the (rows, width, 3) uint8 array pixels as the image rows
+        starting at row y."""
+        t = self.tile
+        for row in range(len(pixels)):
+            ty, ly = divmod(y + row, t)
+            for tx in range(self.tiles_x):
+                x0 = tx * t
+                span = pixels[row, x0:x0 + t]
+                self.tiles[ty, tx, ly, :len(span)] = span
+        self.cache.clear()
+
+    def _tile(self, number):
+        """The pixels of tile number (ty * tiles_x + tx) as bytes."""
+        cache = self.cache
+        buf = cache.get(number)
+        if buf is not None:
+            self.hits += 1
+            cache.move_to_end(number)
+            return buf
+        self.misses += 1
+        buf = cache[number] = self.tiles[divmod(number, self.tiles_x)].tobytes()
+        if len(cache) > self.max_tiles:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return buf
+
+    def pixel(self, x, y):
+        """The (r, g, b) values of pixel (x, y)."""
+        t = self.tile
+        ty, ly = divmod(y, t)
+        tx, lx = divmod(x, t)
+        buf = self._tile(ty * self.tiles_x + tx)
+        k = (ly * t + lx) * 3
+        return buf[k], buf[k+1], buf[k+2]
+
+    def tile_stats(self):
+        """Tile cache counters and the number of cached tiles, as a dict."""
+        return {'tiles': len(self.cache), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    def successors(self, state):
+        """As ImageProblem.successors: the 8 neighbours of state, in the
+        same order and with the same edge costs."""
+        x, y = state
+        w, h, t = self.width, self.height, self.tile
+        tx, lx = divmod(x, t)
+        ty, ly = divmod(y, t)
+        left_ok = x > 0
+        right_ok = x < w - 1
+        up_ok = y > 0
+        down_ok = y < h - 1
+        neighbours = []
+        if left_ok:
+            neighbours.append((x-1, y))
+        if right_ok:
+            neighbours.append((x+1, y))
+        if up_ok:
+            neighbours.append((x, y-1))
+        if down_ok:
+            neighbours.append((x, y+1))
+        if left_ok:
+            if up_ok:
+                neighbours.append((x-1, y-1))
+            if down_ok:
+                neighbours.append((x-1, y+1))
+        if right_ok:
+            if up_ok:
+                neighbours.append((x+1, y-1))
+            if down_ok:
+                neighbours.append((x+1, y+1))
+
+        if 0 < lx < t - 1 and 0 < ly < t - 1:
+            # every neighbour is on the same tile: read it once
+            buf = self._tile(ty * self.tiles_x + tx)
+            x0, y0 = tx * t, ty * t
+
+            def pixel(x, y):
+                k = ((y - y0) * t + x - x0) * 3
+                return buf[k], buf[k+1], buf[k+2]
+        else:
+            pixel = self.pixel
+        r, g, b = pixel(x, y)
+        for ns in neighbours:
+            r2, g2, b2 = pixel(*ns)
+            yield ns, 1 + ((r - r2) / 32) ** 2 + ((g - g2) / 32) ** 2 + ((b - b2) / 32) ** 2
+
+    def num_states(self):
+        """Number of states (pixels) in the problem."""
+        return self.width * self.height
+
+    def index_shape(self):
+        """(rows, cols) of the flat index layout: a state's index is
+        row * cols + col, with state = (col, row)."""
+        return self.height, self.width
+
+    def to_index(self, state):
+        """Encode a state as a flat integer index."""
+        return state[1] * self.width + state[0]
+
+    def from_index(self, index):
+        """Decode a flat integer index back into a state."""
+        y, x = divmod(index, self.width)
+        return (x, y)
+
+    def index_successors(self, i):
+        """successors() over flat integer indices."""
+        w = self.width
+        for (x, y), cost in self.successors((i % w, i // w)):
+            yield y * w + x, cost
+
+    def path_from_indices(self, indices):
+        return Path.from_indices(indices, self.width, transpose=True)
+
+    def region(self, x0, y0, x1, y1):
+        """The pixels of the rectangle [x0, x1) x [y0, y1) as a (rows,
+        cols, 3) uint8 array, read straight from the map file."""
+        t = self.tile
+        out = np.empty((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                ya, yb = max(y0, ty * t), min(y1, (ty + 1) * t)
+                xa, xb = max(x0, tx * t), min(x1, (tx + 1) * t)
+                out[ya-y0:yb-y0, xa-x0:xb-x0] = \
+                    self.tiles[ty, tx, ya-ty*t:yb-ty*t, xa-tx*t:xb-tx*t]
+        return out
+
+    def show_path(self, listofstates, pathfname='path.png', reached=None, margin=16):
+        """Paint the states red on the part of the map around them (their
+        bounding box plus margin pixels), optionally shading the reached
+        states, and save it.  Only that part of the map is read."""
+        self.show_paths([listofstates], pathfname, () if reached is None else [reached], margin)
+
+    def show_paths(self, paths, pathfname='paths.png', reached=(), margin=16):
+        """Paint every path in paths, each in the next of ImageProblem's
+        PATH_COLORS, on the part of the map around all of them, shading
+        the states in each of the reached collections first, and save
+        it.  Only that part of the map is read."""
+        import PIL.Image
+
+        coords = [Path(states).coords for states in paths]
+        every = np.concatenate(coords) if coords else np.empty((0, 2), dtype=np.int64)
+        if not len(every):
+            return
+        x0, y0 = np.maximum(every.min(axis=0) - margin, 0)
+        x1, y1 = np.minimum(every.max(axis=0) + margin + 1, (self.width, self.height))
+        pixels = self.region(x0, y0, x1, y1)
+        for states in reached:
+            seen = Path(states).coords - (x0, y0)
+            seen = seen[((seen >= 0) & (seen < (x1 - x0, y1 - y0))).all(axis=1)]
+            shade = pixels[seen[:, 1], seen[:, 0]] * 0.4 + np.array(ImageProblem.HEAT_COLOR) * 0.6
+            pixels[seen[:, 1], seen[:, 0]] = shade.astype(np.uint8)
+        colors = ImageProblem.PATH_COLORS
+        for k, c in enumerate(coords):
+            pixels[c[:, 1] - y0, c[:, 0] - x0] = colors[k % len(colors)]
+        PIL.Image.fromarray(pixels).save(pathfname)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tiled map files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help="convert an image to a .tiles file")
+    convert.add_argument('image')
+    convert.add_argument('tiles')
+    convert.add_argument('--tile', type=int, default=256,
+                         help="tile side length in pixels (default 256)")
+    args = parser.parse_args()
+
+    prob = TiledImageProblem.convert(args.image, args.tiles, args.tile)
+    print("%dx%d pixels in %dx%d tiles of %d" %
+          (prob.width, prob.height, prob.tiles_x, prob.tiles_y, prob.tile))